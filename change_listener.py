@@ -0,0 +1,141 @@
+import json
+import select
+import threading
+import weakref
+
+# The PostgreSQL channel every System instance notifies and listens on.
+CHANGE_CHANNEL = 'portfolio_changes'
+
+# One listener per database URL and process, shared by all System instances.
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+class ChangeListener(threading.Thread):
+    """
+    Background thread that receives change notifications sent with NOTIFY by other sessions.
+
+    The thread keeps one dedicated autocommit connection that LISTENs on CHANGE_CHANNEL.
+    Each notification payload is decoded from JSON and handed to every subscribed
+    callback, which can then invalidate or patch its local caches. Subscribers are held
+    through weak references, so a System that is garbage collected simply stops
+    receiving notifications.
+    """
+
+    def __init__(self, engine, poll_timeout: float = 5.0):
+        """
+        Initializes a new ChangeListener instance. The thread is not started yet.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): The engine of the primary database.
+            poll_timeout (float, optional): Seconds to wait for a notification before
+                checking whether the thread should stop. Defaults to 5.0.
+        """
+        super().__init__(name='ChangeListener', daemon=True)
+        self._engine = engine
+        self._poll_timeout = poll_timeout
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def subscribe(self, callback):
+        """
+        Registers a callback that receives every decoded notification payload (a dict).
+        Bound methods are stored as weak references.
+
+        Args:
+            callback (callable): A function taking a single dict argument.
+        """
+        if hasattr(callback, '__self__'):
+            reference = weakref.WeakMethod(callback)
+        else:
+            reference = lambda: callback
+        with self._subscribers_lock:
+            self._subscribers.append(reference)
+
+    def stop(self):
+        """
+        Asks the thread to stop after its current poll.
+        """
+        self._stop_event.set()
+
+    def run(self):
+        """
+        Listens for notifications until stopped, reconnecting with a growing delay
+        if the connection is lost.
+        """
+        retry_delay = 1.0
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+                retry_delay = 1.0
+            except Exception as error:
+                print(f"Change listener lost its connection ({error}). Retrying in {retry_delay}s.")
+                self._stop_event.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 60.0)
+
+    def _listen(self):
+        """
+        Opens the LISTEN connection and dispatches notifications until stopped.
+        """
+        raw_connection = self._engine.raw_connection()
+        raw_connection.detach()  # The connection is kept for the lifetime of the thread, not returned to the pool
+        connection = raw_connection.driver_connection
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANGE_CHANNEL};")
+            while not self._stop_event.is_set():
+                ready, _, _ = select.select([connection], [], [], self._poll_timeout)
+                if not ready:
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    self._dispatch(notification.payload)
+        finally:
+            raw_connection.close()
+
+    def _dispatch(self, raw_payload: str):
+        """
+        Decodes a payload and passes it to all live subscribers.
+
+        Args:
+            raw_payload (str): The JSON payload of the notification.
+        """
+        try:
+            payload = json.loads(raw_payload)
+        except ValueError:
+            print(f"Ignored malformed change notification: {raw_payload!r}")
+            return
+
+        with self._subscribers_lock:
+            self._subscribers = [ref for ref in self._subscribers if ref() is not None]
+            callbacks = [ref() for ref in self._subscribers]
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(payload)
+            except Exception as error:
+                print(f"Change notification handler failed: {error}")
+
+
+def get_change_listener(engine) -> ChangeListener:
+    """
+    Retrieves the process-wide listener of a database, starting it on first use.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The engine of the primary database.
+
+    Returns:
+        ChangeListener: The running listener thread.
+    """
+    key = engine.url.render_as_string(hide_password=False)
+    with _listeners_lock:
+        listener = _listeners.get(key)
+        if listener is None or not listener.is_alive():
+            listener = ChangeListener(engine)
+            listener.start()
+            _listeners[key] = listener
+        return listener
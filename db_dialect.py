@@ -0,0 +1,127 @@
+import json
+
+
+class PostgresDialect:
+    """
+    SQL building blocks of the PostgreSQL backend, the reference dialect of the System.
+
+    The System's queries are written in portable SQL wherever possible; the few
+    constructs that differ between backends are produced by a dialect object, so
+    every query runs unchanged on PostgreSQL and on the embedded SQLite backend.
+    """
+
+    name = 'postgresql'
+    supports_copy = True  # COPY streaming for bulk export/import and columnar fetches
+    supports_notify = True  # LISTEN/NOTIFY for cross-process cache invalidation
+    supports_locking = True  # SELECT ... FOR UPDATE and advisory locks
+
+    def adapt_ddl(self, query: str) -> str:
+        """
+        Adapts a CREATE TABLE statement written for PostgreSQL to this backend.
+
+        Args:
+            query (str): The PostgreSQL DDL statement.
+
+        Returns:
+            str: The statement to execute.
+        """
+        return query
+
+    def month(self, column: str) -> str:
+        """
+        Builds an expression that truncates a timestamp column to the first day of its month.
+
+        Args:
+            column (str): A column name or SQL expression.
+
+        Returns:
+            str: The SQL expression.
+        """
+        return f"date_trunc('month', {column})"
+
+    def seconds_between(self, end: str, start: str) -> str:
+        """
+        Builds an expression for the number of seconds between two timestamps.
+
+        Args:
+            end (str): The later timestamp expression.
+            start (str): The earlier timestamp expression.
+
+        Returns:
+            str: The SQL expression.
+        """
+        return f"EXTRACT(EPOCH FROM ({end} - {start}))"
+
+    def in_list(self, column: str, param: str) -> str:
+        """
+        Builds a condition that is true when a column equals any value of a list parameter.
+        The parameter value must be prepared with list_param.
+
+        Args:
+            column (str): A column name or SQL expression.
+            param (str): The name of the bound parameter (without the colon).
+
+        Returns:
+            str: The SQL condition.
+        """
+        return f"{column} = ANY(:{param})"
+
+    def list_param(self, values) -> list:
+        """
+        Prepares a list of values for a parameter used in in_list.
+
+        Args:
+            values (iterable): The values.
+
+        Returns:
+            list: The bound parameter value.
+        """
+        return list(values)
+
+
+class SQLiteDialect(PostgresDialect):
+    """
+    SQL building blocks of the embedded SQLite backend, used for fast local runs and tests.
+
+    SQLite has no COPY, LISTEN/NOTIFY or row locks (it serializes writers on the whole
+    database), so those features are reported as unsupported.
+    """
+
+    name = 'sqlite'
+    supports_copy = False
+    supports_notify = False
+    supports_locking = False
+
+    def adapt_ddl(self, query: str) -> str:
+        return (query
+                .replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+                .replace("TIMESTAMP(0) WITHOUT TIME ZONE", "TIMESTAMP"))
+
+    def month(self, column: str) -> str:
+        return f"datetime({column}, 'start of month')"
+
+    def seconds_between(self, end: str, start: str) -> str:
+        return f"((julianday({end}) - julianday({start})) * 86400)"
+
+    def in_list(self, column: str, param: str) -> str:
+        return f"{column} IN (SELECT value FROM json_each(:{param}))"
+
+    def list_param(self, values) -> str:
+        return json.dumps(list(values))
+
+
+def get_dialect(backend: str):
+    """
+    Retrieves the dialect of a backend.
+
+    Args:
+        backend (str): Either 'postgresql' or 'sqlite'.
+
+    Returns:
+        PostgresDialect | SQLiteDialect: The dialect object.
+    """
+    if backend in ('postgresql', 'postgres'):
+        return PostgresDialect()
+    if backend == 'sqlite':
+        return SQLiteDialect()
+    raise ValueError(f"Invalid database backend '{backend}'. Please choose 'postgresql' or 'sqlite'.")
@@ -1,39 +1,136 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, event
+from sqlalchemy.pool import SingletonThreadPool
 import random
 import string
 import bcrypt
 from functools import wraps
-import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import datetime
+import time
 import os
+import io
+import json
+import uuid
+import csv
+import tempfile
 from dotenv import load_dotenv
+from position_book import PositionBook
+from change_listener import CHANGE_CHANNEL, get_change_listener
+from risk import RiskModel
+from market_data import get_default_gateway
+from price_refresher import start_price_refresher
+from profiling import profiled
+from db_dialect import get_dialect
+
+# Column types of every table, keyed by the source names used across the System API.
+# Used by the bulk COPY helpers to type exported files without inspecting each row.
+TABLE_COLUMN_TYPES = {
+    'users': {
+        'user_id': 'text', 'user_name': 'text', 'password': 'text', 'funds': 'numeric(12,2)'
+    },
+    'positions': {
+        'position_id': 'text', 'user_id': 'text', 'position_name': 'text', 'position_amount': 'numeric(12,2)',
+        'open_price': 'numeric(12,2)', 'asset_share': 'numeric(18,8)', 'asset_type': 'text', 'sector': 'text',
+        'open_datetime': 'timestamp'
+    },
+    'transactions': {
+        'transaction_id': 'text', 'user_id': 'text', 'position_name': 'text', 'position_amount': 'numeric(12,2)',
+        'open_price': 'numeric(12,2)', 'close_price': 'numeric(12,2)', 'loss_profit': 'numeric(12,2)',
+        'open_datetime': 'timestamp', 'close_datetime': 'timestamp'
+    },
+    'user_history': {
+        'action_id': 'integer', 'position_id': 'text', 'user_id': 'text', 'position_name': 'text',
+        'position_amount': 'numeric(12,2)', 'open_price': 'numeric(12,2)', 'close_price': 'numeric(12,2)',
+        'loss_profit': 'numeric(12,2)', 'asset_share': 'numeric(18,8)', 'asset_type': 'text', 'sector': 'text',
+        'open_datetime': 'timestamp', 'close_datetime': 'timestamp', 'state': 'text'
+    }
+}
+
+# Bulk export/import order. Parents come first so foreign keys hold during an import.
+BULK_TABLES = {'users': 'users', 'positions': 'positions', 'transactions': 'transactions', 'history': 'user_history'}
 
 class System:
-    def __init__(self):
+    def __init__(self, backend: str = None, db_path: str = None):
         # Load variables from .env file
         load_dotenv()
 
-        # Read the variables
-        db_user = os.getenv('DB_USER')
-        db_password = os.getenv('DB_PASSWORD')
-        db_host = os.getenv('DB_HOST')
-        db_name = os.getenv('DB_NAME')
-
-        # Validate that all variables are present
-        if not all([db_user, db_password, db_host, db_name]):
-            raise ValueError("One or more required database environment variables are not set in your .env file.")
+        # Pick the database backend: PostgreSQL (default) or embedded SQLite for fast local runs and tests.
+        backend = (backend or os.getenv('DB_BACKEND', 'postgresql')).lower()
+        self.dialect = get_dialect(backend)
+
+        if self.dialect.name == 'sqlite':
+            # ':memory:' gives this instance a private in-memory database, so tests can run in parallel.
+            # ':memory:<name>' gives a named in-memory database shared by all System instances of the
+            # process that use the same name (e.g. several sessions of one scenario).
+            db_path = db_path or os.getenv('DB_PATH', ':memory:')
+            engine_options = {'connect_args': {'timeout': 30}}
+            if db_path.startswith(':memory:'):
+                memory_name = db_path[len(':memory:'):] or f"data_handling_{uuid.uuid4().hex}"
+                connection_string = f'sqlite+pysqlite:///file:{memory_name}?mode=memory&cache=shared&uri=true'
+                engine_options['poolclass'] = SingletonThreadPool  # Keeps a connection open, or the database is dropped
+            else:
+                connection_string = f'sqlite+pysqlite:///{db_path}'
+            self.engine = create_engine(connection_string, **engine_options)
+            self.replica_engines = []
+        else:
+            # Read the variables
+            db_user = os.getenv('DB_USER')
+            db_password = os.getenv('DB_PASSWORD')
+            db_host = os.getenv('DB_HOST')
+            db_name = os.getenv('DB_NAME')
+
+            # Validate that all variables are present
+            if not all([db_user, db_password, db_host, db_name]):
+                raise ValueError("One or more required database environment variables are not set in your .env file.")
+
+            # Construct the connection string
+            connection_string = f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}/{db_name}'
+            
+            self.engine = create_engine(connection_string)
+
+            # Optional read replicas, given as a comma separated list of hosts (e.g. 'localhost:5433,localhost:5434').
+            # They share the credentials and database name of the primary.
+            replica_hosts = [h.strip() for h in os.getenv('DB_REPLICA_HOSTS', '').split(',') if h.strip()]
+            self.replica_engines = [
+                create_engine(f'postgresql+psycopg2://{db_user}:{db_password}@{host}/{db_name}') for host in replica_hosts
+            ]
+        # Read-your-writes: after a write, replicas are only used once they replayed the primary's WAL up to it.
+        self.write_pending = False  # A write happened and its WAL position was not read yet
+        self.write_lsn = None  # WAL position of the session's last write, while some replica may lag behind it
+        self.caught_up_replicas = set()  # Indexes of the replicas that replayed write_lsn
+        self.replica_index = 0
+
+        # How concurrent sessions of the same user are serialized: 'none', 'row' (SELECT ... FOR UPDATE)
+        # or 'advisory' (one PostgreSQL advisory lock per user).
+        self.lock_mode = os.getenv('DB_LOCK_MODE', 'none').lower()
+        if self.lock_mode not in ('none', 'row', 'advisory'):
+            raise ValueError(f"Invalid DB_LOCK_MODE '{self.lock_mode}'. Please choose 'none', 'row' or 'advisory'.")
+        if self.lock_mode != 'none' and not self.dialect.supports_locking:
+            raise ValueError(f"DB_LOCK_MODE '{self.lock_mode}' is not supported by the {self.dialect.name} backend.")
+        self.lock_wait_time = 0.0
+
+        # Cost factor of new password hashes. Tests and local benchmarks can lower it (minimum 4).
+        self.bcrypt_rounds = int(os.getenv('BCRYPT_ROUNDS', '12'))
 
-        # Construct the connection string
-        connection_string = f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}/{db_name}'
-        
-        self.engine = create_engine(connection_string)
         self.user_id = None
         self.user_name = None 
         self.signed_in = False
+        self.position_book = None
+        self.market_data = get_default_gateway()  # Shared by all sessions of the process
+        self.session_token = uuid.uuid4().hex  # Identifies this session's own change notifications
         self.db_calls = 0
         self.api_calls = 0
+        self.db_time = 0.0  # Seconds spent executing SQL, used by the profiling hooks
+        self.api_time = 0.0  # Seconds spent waiting on market data, used by the profiling hooks
         self.create_empty()
+
+        # Opt-in cache invalidation across processes that serve the same users.
+        if os.getenv('DB_LISTEN_CHANGES', '').lower() in ('1', 'true', 'yes'):
+            self.start_change_listener()
+        # Opt-in background refresh of the quotes of hot tickers.
+        if os.getenv('PRICE_REFRESHER', '').lower() in ('1', 'true', 'yes'):
+            self.start_price_refresher()
         
         
     def create_empty(self):
@@ -96,16 +193,20 @@ class System:
             );"""
         ]
         for query in queries:
-            self.execute_query(query)
+            self.execute_query(self.dialect.adapt_ddl(query))
         self.db_calls = 0
         self.api_calls = 0
 
-    def execute_query(self, query: str, params=None, fetch=None, connection=None):
+    def execute_query(self, query: str, params=None, fetch=None, connection=None, read_only=False):
         """
         Executes a single SQL query with optional parameters and optional result fetching.
         The function uses bound parameters to avoid SQL injection and can return either
         all rows, a single row, or nothing depending on the 'fetch' argument.
 
+        Read-only queries are routed to one of the configured replica engines (round robin),
+        but only to replicas that already replayed this session's last write, so the
+        session always sees its own writes (see select_engine).
+
         Args:
             query (str): A valid SQL query string with named parameters (e.g., :name).
             params (dict, optional): A mapping of parameter names to values. Defaults to {}.
@@ -115,12 +216,16 @@ class System:
                 connection. If provided, the query is executed within the context of this
                 connection's transaction. If None, a new transaction is created.
                 Defaults to None.
+            read_only (bool, optional): Set to True if the query does not modify any data,
+                which allows it to be served by a read replica. Defaults to False.
 
         Returns:
             Any: When fetch is 'all' returns a list of rows; when 'one' returns a single row;
             otherwise returns None.
         """
         self.db_calls += 1 
+        if not read_only:
+            self.write_pending = True
         
         def _execute_and_fetch(conn): # Helper function to avoid code duplication
             result = conn.execute(text(query), params or {})
@@ -132,10 +237,73 @@ class System:
                 return result
             return None
         
-        if connection:
-            return _execute_and_fetch(connection)
-        with self.engine.begin() as conn:
-            return _execute_and_fetch(conn)
+        started = time.perf_counter()
+        try:
+            if connection:
+                return _execute_and_fetch(connection)
+            with self.select_engine(read_only).begin() as conn:
+                return _execute_and_fetch(conn)
+        finally:
+            self.db_time += time.perf_counter() - started
+
+    def select_engine(self, read_only: bool = False):
+        """
+        Picks the engine a query should run on.
+
+        Writes always go to the primary. Reads go to the next replica in round robin order
+        that has replayed the WAL up to this session's last write (read-your-writes). After
+        a write, the primary's WAL position is read once, and each replica is checked against
+        it until it catches up; if no replica has caught up yet, the read goes to the primary.
+
+        Args:
+            read_only (bool, optional): Whether the query only reads data. Defaults to False.
+
+        Returns:
+            sqlalchemy.engine.Engine: The engine to execute the query on.
+        """
+        if not read_only or not self.replica_engines:
+            return self.engine
+        if self.write_pending:
+            self.write_pending = False
+            self.write_lsn = self.read_wal_position(self.engine, "SELECT CAST(pg_current_wal_lsn() AS TEXT);")
+            self.caught_up_replicas = set()
+
+        for _ in range(len(self.replica_engines)):
+            index = self.replica_index % len(self.replica_engines)
+            self.replica_index += 1
+            if self.write_lsn is None or index in self.caught_up_replicas:
+                return self.replica_engines[index]
+            replayed = self.read_wal_position(
+                self.replica_engines[index],
+                "SELECT COALESCE(pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn), false);",
+                {"lsn": self.write_lsn}
+            )
+            if replayed:
+                self.caught_up_replicas.add(index)
+                if len(self.caught_up_replicas) == len(self.replica_engines):
+                    self.write_lsn = None  # Every replica has the write, stop checking
+                return self.replica_engines[index]
+        return self.engine
+
+    def read_wal_position(self, engine, query: str, params=None):
+        """
+        Runs a single-value WAL position query for select_engine, counted like any other database call.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): The primary or a replica engine.
+            query (str): The query, returning a single value.
+            params (dict, optional): A mapping of parameter names to values. Defaults to {}.
+
+        Returns:
+            Any: The value returned by the query.
+        """
+        self.db_calls += 1
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                return conn.execute(text(query), params or {}).scalar()
+        finally:
+            self.db_time += time.perf_counter() - started
 
     def requires_login(func):
         """
@@ -155,6 +323,232 @@ class System:
             return func(self, *args, **kwargs)
         return wrapper
 
+    def after_commit(self, connection, callback):
+        """
+        Runs a callback once the transaction of the given connection commits.
+        If no connection is given, the work was already committed by execute_query,
+        so the callback runs immediately. On rollback the callback is never run.
+
+        Args:
+            connection (sqlalchemy.engine.Connection): The connection of the running transaction, or None.
+            callback (callable): A function without arguments.
+        """
+        if connection is None:
+            callback()
+        else:
+            event.listen(connection, 'commit', lambda conn: callback(), once=True)
+
+    def notify_change(self, kind: str, connection=None, **details):
+        """
+        Sends a change notification to every process listening on CHANGE_CHANNEL.
+        When a connection is given, NOTIFY runs inside its transaction, so the
+        notification is only delivered if (and when) that transaction commits.
+
+        Args:
+            kind (str): The kind of change: 'funds', 'position_open' or 'position_close'.
+            connection (sqlalchemy.engine.Connection, optional): An existing database
+                connection to use for the operation. Defaults to None.
+            **details: Extra JSON serializable fields for the payload (e.g. position_ids).
+        """
+        if not self.dialect.supports_notify:
+            return
+        payload = {'kind': kind, 'user_id': self.user_id, 'origin': self.session_token, **details}
+        query = "SELECT pg_notify(:channel, :payload);"
+        params = {'channel': CHANGE_CHANNEL, 'payload': json.dumps(payload)}
+        self.execute_query(query, params, connection=connection)
+
+    def start_change_listener(self):
+        """
+        Subscribes this session to the process-wide change listener thread, starting
+        the thread if it is not running yet. From then on, changes made by other
+        sessions to the logged-in user's positions are applied to the position book.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if not self.dialect.supports_notify:
+            raise RuntimeError(f"Change notifications are not supported by the {self.dialect.name} backend.")
+        get_change_listener(self.engine).subscribe(self.handle_change_notification)
+
+    def start_price_refresher(self, **kwargs):
+        """
+        Starts the process-wide background price refresher if it is not running yet.
+        It turns on the market data gateway's quote cache and keeps the quotes of the
+        most held and most traded tickers fresh in it, so orders rarely wait on the network.
+
+        Args:
+            **kwargs: Options of PriceRefresher (interval, top_n, batch_size, ...).
+
+        Returns:
+            PriceRefresher: The running refresher thread.
+        """
+        return start_price_refresher(self.engine, self.market_data, **kwargs)
+
+    def handle_change_notification(self, payload: dict):
+        """
+        Invalidates or patches the local caches after another session changed the logged-in user's data.
+        This runs on the listener thread.
+
+        - 'position_close' notifications that list the closed IDs are patched into the
+          position book directly.
+        - 'position_open' (and any close without IDs) drops the book, so it is reloaded
+          from the database on its next use.
+        - 'funds' changes need no action, as the balance is always read from the database.
+
+        Args:
+            payload (dict): The decoded notification payload.
+        """
+        if payload.get('origin') == self.session_token or payload.get('user_id') != self.user_id:
+            return
+        book = self.position_book
+        if book is None or book.get_user_id() != payload.get('user_id'):
+            return
+
+        kind = payload.get('kind')
+        if kind == 'position_close' and payload.get('position_ids') is not None:
+            for position_id in payload['position_ids']:
+                book.remove(position_id)
+        elif kind in ('position_open', 'position_close'):
+            self.position_book = None
+
+    @requires_login
+    def lock_user_db(self, connection):
+        """
+        Serializes the logged-in user's balance changes within the given transaction, according to 'lock_mode'.
+
+        - 'row': locks the user's row with SELECT ... FOR UPDATE.
+        - 'advisory': takes a transaction-level advisory lock keyed on the user ID.
+        - 'none': does nothing.
+
+        The lock is released when the transaction ends. Time spent waiting is added to 'lock_wait_time'.
+
+        Args:
+            connection (sqlalchemy.engine.Connection): The connection of the running transaction.
+
+        Returns:
+            float | None: The user's funds read under the lock, or None when lock_mode is 'none'.
+        """
+        if self.lock_mode == 'none':
+            return None
+
+        started = time.perf_counter()
+        params = {"user_id": self.user_id}
+        if self.lock_mode == 'advisory':
+            self.execute_query("SELECT pg_advisory_xact_lock(hashtext(:user_id));", params, fetch="one", connection=connection)
+            result = self.execute_query("SELECT funds FROM users WHERE user_id = :user_id;", params, fetch="one", connection=connection)
+        else:
+            result = self.execute_query("SELECT funds FROM users WHERE user_id = :user_id FOR UPDATE;", params, fetch="one", connection=connection)
+        self.lock_wait_time += time.perf_counter() - started
+
+        if not result:
+            raise ValueError("User id not found.")
+        return float(result[0])
+
+    @requires_login
+    def lock_positions_db(self, positions_list: list, connection, asset_name: str = None) -> list:
+        """
+        Re-reads the positions about to be closed inside the closing transaction, so that a stale
+        position book (e.g. after another session of the same user closed them) or two sessions
+        closing at once can never close the same position twice. When closing a whole asset, the
+        asset's positions are selected by ticker, so positions opened by another session that the
+        book does not know about are closed too.
+
+        - 'row': locks them with SELECT ... FOR UPDATE SKIP LOCKED, so positions that another session
+          is closing right now are skipped instead of waited on.
+        - 'advisory': takes the user's advisory lock, then keeps the positions that still exist.
+        - 'none': keeps the positions that still exist, without locking them.
+
+        Positions that turn out to be gone are removed from the position book, in every mode.
+
+        Args:
+            positions_list (list): The positions the caller intends to close (for an asset,
+                the ones the position book knows about).
+            connection (sqlalchemy.engine.Connection): The connection of the running transaction.
+            asset_name (str, optional): Close every open position of this ticker instead of
+                only those in positions_list. Defaults to None.
+
+        Returns:
+            list: The positions that can safely be closed, in the original order (in opening
+            order when closing an asset).
+        """
+        query = """
+        SELECT position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector, open_datetime
+        FROM positions
+        """
+        if asset_name is not None:
+            query += "WHERE position_name = :asset_name AND user_id = :user_id ORDER BY open_datetime, position_id"
+            params = {"asset_name": asset_name, "user_id": self.user_id}
+        else:
+            query += f"WHERE {self.dialect.in_list('position_id', 'ids')} AND user_id = :user_id"
+            params = {"ids": self.dialect.list_param(position[0] for position in positions_list), "user_id": self.user_id}
+        started = time.perf_counter()
+        if self.lock_mode == 'advisory':
+            self.lock_user_db(connection)
+        elif self.lock_mode == 'row':
+            query += " FOR UPDATE SKIP LOCKED"
+        rows = {row[0]: row for row in self.execute_query(query, params, fetch="all", connection=connection)}
+        if self.lock_mode == 'row':
+            self.lock_wait_time += time.perf_counter() - started
+
+        if asset_name is not None:
+            locked = list(rows.values())
+        else:
+            locked = [rows[position[0]] for position in positions_list if position[0] in rows]
+        missing = [position[0] for position in positions_list if position[0] not in rows]
+        if missing and self.lock_mode == 'row':
+            # SKIP LOCKED also leaves out rows another session is closing right now, so only
+            # the ones a plain (non-locking) read no longer finds are known to be gone.
+            query = f"SELECT position_id FROM positions WHERE {self.dialect.in_list('position_id', 'ids')};"
+            existing = self.execute_query(query, {"ids": self.dialect.list_param(missing)}, fetch="all", connection=connection)
+            missing = set(missing) - {row[0] for row in existing}
+        for position_id in missing:
+            self.get_position_book().remove(position_id)  # Closed by another session
+        return locked
+
+    @requires_login
+    def load_position_book(self) -> PositionBook:
+        """
+        Loads all open positions of the logged-in user into the in-memory position book.
+        This is done once at login; afterwards the book is kept in sync by open_position
+        and close_position when their transactions commit.
+
+        Args:
+            None
+
+        Returns:
+            PositionBook: The freshly loaded book.
+        """
+        query = """
+        SELECT position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector, open_datetime
+        FROM positions
+        WHERE user_id = :user_id
+        ORDER BY open_datetime, position_id;
+        """
+        rows = self.execute_query(query, {"user_id": self.user_id}, fetch="all", read_only=True)
+        book = PositionBook(self.user_id)
+        book.load(rows)
+        self.position_book = book
+        return book
+
+    @requires_login
+    def get_position_book(self) -> PositionBook:
+        """
+        Retrieves the in-memory position book of the logged-in user, loading it if needed.
+
+        Args:
+            None
+
+        Returns:
+            PositionBook: The position book of the session.
+        """
+        book = self.position_book
+        if book is None:
+            book = self.load_position_book()
+        return book
+
     def id_generator(self, id_type: str) -> str:
         """
         Generates a unique, random ID for either a 'user' or a 'position' depending on the 'id_type' argument.
@@ -182,7 +576,7 @@ class System:
                 generated_user_id = f"{letter_1}{letter_2}{numbers}"
 
                 query = "SELECT 1 FROM users WHERE user_id = :id"
-                if not self.execute_query(query, {"id": generated_user_id}, fetch="one"):
+                if not self.execute_query(query, {"id": generated_user_id}, fetch="one", read_only=True):
                     return generated_user_id  # Return only if it's unique, else the loop continues
         elif id_type == "position":
             chars = string.ascii_uppercase + string.digits
@@ -193,9 +587,35 @@ class System:
                 UNION ALL
                 SELECT 1 FROM transactions WHERE transaction_id = :id; 
                 """
-                if not self.execute_query(query, {"id": local_id}, fetch="one"):
+                if not self.execute_query(query, {"id": local_id}, fetch="one", read_only=True):
                     return local_id  # Returns the new ID only if it's unique, else the loop continues        
             
+    def generate_position_ids(self, count: int) -> list:
+        """
+        Generates many unique position IDs at once, in the same 10-character format as id_generator.
+        All candidates are checked against the 'positions' and 'transactions' tables with one
+        query per round, and only the colliding ones are regenerated.
+
+        Args:
+            count (int): The number of IDs to generate.
+
+        Returns:
+            list: A list of unique IDs.
+        """
+        chars = string.ascii_uppercase + string.digits
+        unique_ids = []
+        while len(unique_ids) < count:
+            candidates = {''.join(random.choices(chars, k=10)) for _ in range(count - len(unique_ids))}
+            candidates -= set(unique_ids)
+            query = f"""
+            SELECT position_id FROM positions WHERE {self.dialect.in_list('position_id', 'ids')}
+            UNION ALL
+            SELECT transaction_id FROM transactions WHERE {self.dialect.in_list('transaction_id', 'ids')};
+            """
+            taken = self.execute_query(query, {"ids": self.dialect.list_param(candidates)}, fetch="all", read_only=True)
+            unique_ids.extend(candidates - {row[0] for row in taken})
+        return unique_ids
+
     def insert_new_user_db(self, user_id: str, user_name: str, password: str, account_funds: float):
         """
         Inserts a new user into the database.
@@ -219,6 +639,7 @@ class System:
         self.execute_query(query, params)
         print(f"New user '{user_name}' added to the database with ID: {user_id}")            
 
+    @profiled
     def register_user(self, user_name: str, password: str):
         """
         Registers a new user in the system using username and password inputs.
@@ -246,16 +667,17 @@ class System:
         WHERE user_name = :username
         """ 
         params = {"username": local_username}
-        result = self.execute_query(query, params, fetch="one") 
+        result = self.execute_query(query, params, fetch="one", read_only=True)
 
         if result: # If result is found, it means the username already exists
             raise ValueError(f"Username '{local_username}' already exists. Try another one.") 
         
-        hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode() # Hash the password before storing
+        hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=self.bcrypt_rounds)).decode() # Hash the password before storing
         local_user_id = self.id_generator("user")  # Generate a unique user ID
         local_funds = 0.0
         self.insert_new_user_db(local_user_id, local_username, hashed_password, local_funds)
 
+    @profiled
     def log_in_user(self, user_name: str, password: str):
         """
         Authenticates a user by verifying their username and password.
@@ -281,7 +703,7 @@ class System:
         WHERE user_name = :u
         """
         params = {"u": local_user_name}
-        result = self.execute_query(query, params, fetch="one")
+        result = self.execute_query(query, params, fetch="one", read_only=True)
 
         if not result:
             raise ValueError(f"The username '{local_user_name}' was not found.") 
@@ -294,8 +716,10 @@ class System:
         self.user_id = stored_user_id
         self.user_name = stored_user_name
         self.signed_in = True
+        self.load_position_book()
         print(f"Logged in as {self.user_name} (ID: {self.user_id})")
 
+    @profiled
     @requires_login
     def log_out_user(self):
         """
@@ -314,26 +738,30 @@ class System:
         self.user_id = None
         self.user_name = None
         self.signed_in = False
+        self.position_book = None
         print("Logged out successfully.")
             
+    @profiled
     @requires_login
-    def get_funds_db(self) -> float:
+    def get_funds_db(self, primary: bool = False) -> float:
         """
         Function that gets the account balance from the database.
         
         Args:
-            None
+            primary (bool, optional): Set to True to read the balance from the primary instead of
+                a replica, e.g. when checking the funds right before spending them. Defaults to False.
         
         Returns:
             float: A float representing the current funds in the user's account.
         """
         query = "SELECT funds FROM users WHERE user_id = :user_id"
         params = {"user_id": self.user_id}
-        result = self.execute_query(query, params, fetch="one")
+        result = self.execute_query(query, params, fetch="one", read_only=not primary)
         if not result:
             raise ValueError("User id not found.")
         return float(result[0])
     
+    @profiled
     @requires_login
     def modify_funds_db(self, amount: float, connection=None):
         """
@@ -362,10 +790,12 @@ class System:
             if result is None:
                 raise RuntimeError("Failed to update account balance. User ID may not exist.")
             new_balance = float(result[0])
+            self.notify_change('funds', connection=connection)
             print(f"Balance updated by {amount}$. New balance: ${new_balance}")
         else:
             print(f"Amount was 0 so balance was not changed.")
 
+    @profiled
     @requires_login
     def open_position(self, asset_name: str, position_amount: float):
         """
@@ -391,7 +821,7 @@ class System:
             raise ValueError("Minimum amount to open a position is 10.")
         if not isinstance(asset_name, str): 
             raise TypeError("Asset name must be a string.")
-        if self.get_funds_db() < position_amount:
+        if self.get_funds_db(primary=True) < position_amount:
             raise ValueError(f"Insufficient funds to open {asset_name} worth {position_amount}$.")
         
         # Retrieve asset data using the function get_asset_data (which also does validity checks)
@@ -403,6 +833,11 @@ class System:
         local_asset_sector = asset_data[2]
 
         with self.engine.begin() as connection:
+            # Re-check the funds under the user's lock, another session may have spent them meanwhile.
+            locked_funds = self.lock_user_db(connection)
+            if locked_funds is not None and locked_funds < position_amount:
+                raise ValueError(f"Insufficient funds to open {asset_name} worth {position_amount}$.")
+
             # Insert the new position into the database
             query = """
             INSERT INTO positions (position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector)
@@ -425,9 +860,195 @@ class System:
             self.log_to_history('OPEN', position_object, connection=connection)
 
             self.modify_funds_db(pos_amount, connection=connection)
+            self.notify_change('position_open', connection=connection, position_ids=[local_position_id])
+            self.after_commit(connection, lambda: self.get_position_book().add(position_object))
 
         print(f"Bought asset {asset_name} with position ID {local_position_id} at price {local_asset_price}$ and {local_asset_share} shares in sector {local_asset_sector}.")
 
+    @profiled
+    @requires_login
+    def import_portfolio_file(self, file_path: str, sheet_name: str = None, ticker_column: str = None,
+                              amount_column: str = None, ticker_aliases: dict = None) -> pd.DataFrame:
+        """
+        Opens positions in bulk from an Excel workbook (e.g. 'My_Assets.xlsx') or a CSV file.
+
+        The whole import runs in a few set-based steps instead of one open_position call per row:
+        1. Reads every sheet (or the given one) and finds the ticker and amount columns.
+        2. Validates tickers and amounts with vectorized pandas checks.
+        3. Resolves the quotes of all distinct tickers in one batch.
+        4. Rejects, in file order, rows that exceed the funds left by the rows accepted so far.
+        5. Inserts all positions and their 'OPEN' history rows and deducts the total
+           cost in a single database transaction.
+
+        Rows that fail any step are skipped and reported; they never block the valid rows.
+
+        Args:
+            file_path (str): Path to an .xlsx/.xls workbook or a .csv file.
+            sheet_name (str, optional): Import only this sheet. Defaults to None, which imports all sheets.
+            ticker_column (str, optional): The column holding the tickers. Defaults to None,
+                which picks the first known name (e.g. 'Ticker', 'Asset name', 'ETF', 'Company').
+            amount_column (str, optional): The column holding the amounts. Defaults to None,
+                which picks 'Amount' or 'position_amount'.
+            ticker_aliases (dict, optional): Maps names used in the file to tickers
+                (e.g. {'NVIDIA': 'NVDA', 'BITCOIN': 'BTC-USD'}). Matching is case-insensitive.
+
+        Returns:
+            pd.DataFrame: A report with one row per input row: sheet, row, ticker, amount,
+            status ('OPENED' or 'FAILED'), position_id, price, shares and error.
+        """
+        rows = self._read_portfolio_file(file_path, sheet_name, ticker_column, amount_column)
+        if rows.empty:
+            print(f"No importable rows found in '{file_path}'.")
+            return rows
+
+        # Vectorized validation of tickers and amounts. The first failing check of a row is reported.
+        aliases = {str(k).strip().upper(): v for k, v in (ticker_aliases or {}).items()}
+        tickers = rows['raw_ticker'].astype('string').str.strip().str.upper()
+        rows['ticker'] = tickers.replace(aliases) if aliases else tickers
+        rows['amount'] = pd.to_numeric(rows['raw_amount'], errors='coerce')
+        rows['error'] = pd.Series(pd.NA, index=rows.index, dtype='string')
+        checks = [
+            (rows['ticker'].isna() | (rows['ticker'] == ''), "Missing ticker."),
+            (~rows['ticker'].fillna('').str.fullmatch(r"[A-Z0-9^][A-Z0-9.\-=^]{0,19}"), "Invalid ticker symbol."),
+            (rows['amount'].isna(), "Amount is not a number."),
+            (rows['amount'] < 10, "Minimum amount to open a position is 10."),
+        ]
+        for failed, message in checks:
+            rows.loc[failed.fillna(False) & rows['error'].isna(), 'error'] = message
+
+        # Resolve the quotes of all distinct valid tickers at once.
+        valid = rows['error'].isna()
+        quotes = self.get_assets_data_api(rows.loc[valid, 'ticker'].tolist())
+        quote_errors = {name: str(data) for name, data in quotes.items() if isinstance(data, Exception)}
+        failed_quote = valid & rows['ticker'].isin(list(quote_errors))
+        rows.loc[failed_quote, 'error'] = rows.loc[failed_quote, 'ticker'].map(quote_errors)
+
+        valid = rows['error'].isna()
+        good_quotes = {name: data for name, data in quotes.items() if not isinstance(data, Exception)}
+        rows['price'] = rows['ticker'].map({name: data[0] for name, data in good_quotes.items()}).where(valid)
+        rows['asset_type'] = rows['ticker'].map({name: data[1] for name, data in good_quotes.items()})
+        rows['sector'] = rows['ticker'].map({name: data[2] for name, data in good_quotes.items()})
+        rows['shares'] = (rows['amount'] / rows['price']).round(8)
+
+        # Accept rows in file order while they fit in the funds left by the rows accepted before them.
+        remaining_funds = self.get_funds_db(primary=True)
+        over_budget = []
+        for index, amount in rows.loc[valid, 'amount'].items():
+            if amount > remaining_funds:
+                over_budget.append(index)
+            else:
+                remaining_funds -= amount
+        rows.loc[over_budget, 'error'] = "Insufficient funds."
+        valid = rows['error'].isna()
+
+        rows['position_id'] = pd.Series(pd.NA, index=rows.index, dtype='string')
+        accepted = rows[valid]
+        if not accepted.empty:
+            rows.loc[valid, 'position_id'] = self.generate_position_ids(len(accepted))
+            accepted = rows[valid]
+            self._insert_positions_bulk(accepted)
+
+        rows['status'] = valid.map({True: 'OPENED', False: 'FAILED'})
+        report = rows[['sheet', 'row', 'ticker', 'amount', 'status', 'position_id', 'price', 'shares', 'error']]
+        print(f"Imported {int(valid.sum())} of {len(rows)} rows from '{file_path}' for a total of {float(rows.loc[valid, 'amount'].sum())}$.")
+        return report.reset_index(drop=True)
+
+    def _read_portfolio_file(self, file_path: str, sheet_name: str = None, ticker_column: str = None,
+                             amount_column: str = None) -> pd.DataFrame:
+        """
+        Reads the ticker and amount columns of every sheet of a portfolio file into one DataFrame.
+        Sheets without both columns (or without rows) are skipped.
+
+        Args:
+            file_path (str): Path to an .xlsx/.xls workbook or a .csv file.
+            sheet_name (str, optional): Read only this sheet. Defaults to None (all sheets).
+            ticker_column (str, optional): The column holding the tickers. Defaults to auto-detection.
+            amount_column (str, optional): The column holding the amounts. Defaults to auto-detection.
+
+        Returns:
+            pd.DataFrame: Columns sheet, row (as numbered in the file), raw_ticker and raw_amount.
+        """
+        if file_path.lower().endswith('.csv'):
+            sheets = {'csv': pd.read_csv(file_path)}
+        else:
+            sheets = pd.read_excel(file_path, sheet_name=sheet_name if sheet_name is not None else None)
+            if sheet_name is not None:
+                sheets = {sheet_name: sheets}
+
+        ticker_candidates = [ticker_column] if ticker_column else ['ticker', 'symbol', 'position_name', 'asset name', 'asset', 'etf', 'crypto asset', 'company']
+        amount_candidates = [amount_column] if amount_column else ['amount', 'position_amount']
+
+        def _find(columns, candidates):
+            lookup = {str(c).strip().lower(): c for c in columns}
+            return next((lookup[c.lower()] for c in candidates if c.lower() in lookup), None)
+
+        frames = []
+        for name, sheet in sheets.items():
+            found_ticker = _find(sheet.columns, ticker_candidates)
+            found_amount = _find(sheet.columns, amount_candidates)
+            if found_ticker is None or found_amount is None or sheet.empty:
+                continue
+            frames.append(pd.DataFrame({
+                'sheet': name,
+                'row': sheet.index + 2,  # +1 for the header line and +1 because spreadsheet rows start at 1
+                'raw_ticker': sheet[found_ticker],
+                'raw_amount': sheet[found_amount],
+            }))
+        if not frames:
+            return pd.DataFrame(columns=['sheet', 'row', 'raw_ticker', 'raw_amount'])
+        return pd.concat(frames, ignore_index=True)
+
+    @requires_login
+    def _insert_positions_bulk(self, accepted: pd.DataFrame):
+        """
+        Inserts validated positions, their 'OPEN' history rows and the funds deduction
+        in a single transaction, using one multi-row statement per table.
+
+        Args:
+            accepted (pd.DataFrame): Rows with position_id, ticker, amount, price, shares, asset_type and sector.
+        """
+        position_ids = accepted['position_id'].tolist()
+        params = [
+            {
+                'position_id': row.position_id,
+                'user_id': self.user_id,
+                'position_name': row.ticker,
+                'position_amount': float(row.amount),
+                'open_price': float(row.price),
+                'asset_share': float(row.shares),
+                'asset_type': row.asset_type,
+                'sector': row.sector
+            }
+            for row in accepted.itertuples(index=False)
+        ]
+        with self.engine.begin() as connection:
+            locked_funds = self.lock_user_db(connection)
+            if locked_funds is not None and locked_funds < float(accepted['amount'].sum()):
+                raise ValueError("Insufficient funds to import the positions, the balance changed during the import.")
+
+            query = """
+            INSERT INTO positions (position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector)
+            VALUES (:position_id, :user_id, :position_name, :position_amount, :open_price, :asset_share, :asset_type, :sector);
+            """
+            self.execute_query(query, params, connection=connection)
+
+            query = f"""
+            INSERT INTO user_history (position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector, open_datetime, state, close_price, loss_profit, close_datetime)
+            SELECT position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector, open_datetime, 'OPEN', NULL, NULL, NULL
+            FROM positions WHERE {self.dialect.in_list('position_id', 'ids')};
+            """
+            self.execute_query(query, {'ids': self.dialect.list_param(position_ids)}, connection=connection)
+
+            query = f"""
+            SELECT position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector, open_datetime
+            FROM positions WHERE {self.dialect.in_list('position_id', 'ids')};
+            """
+            new_positions = self.execute_query(query, {'ids': self.dialect.list_param(position_ids)}, fetch="all", connection=connection)
+
+            self.modify_funds_db(-float(accepted['amount'].sum()), connection=connection)
+            self.notify_change('position_open', connection=connection, position_ids=position_ids if len(position_ids) <= 200 else None)
+            self.after_commit(connection, lambda: [self.get_position_book().add(row) for row in new_positions])
+
     @requires_login
     def calculate_asset_shares(self, asset_price: float, asset_amount: float) -> float:
         """
@@ -444,6 +1065,7 @@ class System:
         shares = asset_amount / asset_price 
         return round(shares, 8)
 
+    @profiled
     @requires_login
     def close_asset(self, position_id: str = None, asset_name: str = None):
         """
@@ -480,9 +1102,10 @@ class System:
             asset_current_price = self.get_asset_current_price(position_name)
             positions_list.append(position)
         else:
-            query = "SELECT * FROM positions WHERE user_id = :user_id AND position_name = :asset_name;"
-            params = {"user_id": self.user_id, "asset_name": asset_name}
-            results = self.execute_query(query, params, fetch="all")
+            # Only validates the request; the closing transaction selects the asset's positions by ticker.
+            results = self.get_position_book().get_by_ticker(asset_name)
+            if not results:
+                results = self.get_positions_by_asset_db(asset_name)  # Possibly opened by another session
             if not results:
                 raise ValueError(f"No open positions found for asset '{asset_name}' for user '{self.user_name}'.")
             positions_list = results
@@ -490,6 +1113,9 @@ class System:
 
         # Open a single transaction to ensure all operations succeed or fail together.
         with self.engine.begin() as connection:
+            positions_list = self.lock_positions_db(positions_list, connection, asset_name=asset_name)
+            if not positions_list:
+                raise ValueError(f"The requested positions were already closed by another session of user '{self.user_name}'.")
             return_balance = self.close_position(positions_list, asset_current_price, connection)
             self.modify_funds_db(return_balance, connection)
 
@@ -515,6 +1141,7 @@ class System:
         """
         
         return_amount = 0.0
+        closed_ids = []
 
         # Iterate through each position provided in the list and extract position data for clarity
         for db_position_object in positions_list:  
@@ -532,13 +1159,21 @@ class System:
             self.complete_transaction(db_position_object, asset_price, profit_loss, connection=connection)
             self.log_to_history('CLOSED', db_position_object, connection=connection)
             self.delete_position_db(db_pos_id, connection=connection)
+            self.after_commit(connection, lambda pos_id=db_pos_id: self.get_position_book().remove(pos_id))
+            closed_ids.append(db_pos_id)
+
+        # NOTIFY payloads are limited to 8000 bytes, so very large closes only announce that something changed.
+        if closed_ids:
+            self.notify_change('position_close', connection=connection, position_ids=closed_ids if len(closed_ids) <= 200 else None)
         
         return return_amount
         
     @requires_login
     def get_position_db(self, position_id: str) -> tuple:
         """
-        Retrieves all data for a single position from the 'positions' table.
+        Retrieves all data for a single position of the logged-in user.
+        The position is served from the in-memory position book; the 'positions' table
+        is only queried if the book does not hold it.
 
         Args:
             position_id (str): The unique identifier for the position.
@@ -546,18 +1181,45 @@ class System:
         Returns:
             tuple: A tuple containing all columns for the found position row, or raises a ValueError.
         """
+        record = self.get_position_book().get(position_id)
+        if record is not None:
+            return record
+
         query = """
         SELECT position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector, open_datetime
         FROM positions
         WHERE position_id = :pos_id AND user_id = :user_id;
         """
         params = {"pos_id": position_id, "user_id": self.user_id}
-        result = self.execute_query(query, params, fetch="one")
+        result = self.execute_query(query, params, fetch="one", read_only=True)
         if not result:
             raise ValueError(f"No position found with ID '{position_id}' for user '{self.user_name}'.")
 
         return result
 
+    @requires_login
+    def get_positions_by_asset_db(self, asset_name: str) -> list:
+        """
+        Retrieves all open positions of an asset for the logged-in user from the 'positions' table,
+        and adds any the position book is missing (e.g. opened by another session) to the book.
+
+        Args:
+            asset_name (str): The ticker of the asset.
+
+        Returns:
+            list: The positions of that asset in the order they were opened (empty if there are none).
+        """
+        query = """
+        SELECT position_id, user_id, position_name, position_amount, open_price, asset_share, asset_type, sector, open_datetime
+        FROM positions
+        WHERE user_id = :user_id AND position_name = :asset_name
+        ORDER BY open_datetime, position_id;
+        """
+        params = {"user_id": self.user_id, "asset_name": asset_name}
+        results = self.execute_query(query, params, fetch="all", read_only=True)
+        book = self.get_position_book()
+        return [book.get(row[0]) or book.add(row) for row in results]
+
     @requires_login
     def complete_transaction(self, position_object: tuple, asset_price_at_close: float, profit_loss: float, connection=None):
         """
@@ -697,8 +1359,9 @@ class System:
         """
         Retrieves live market data for a given financial asset.
 
-        This function uses the yfinance library to fetch an asset's current
-        market price, type, and sector. It includes robust checks to handle
+        This function uses the yfinance library, through the process-wide market data
+        gateway (which coalesces concurrent requests and rate limits them), to fetch an
+        asset's current market price, type, and sector. It includes robust checks to handle
         different market states (e.g., open, closed, post-market) and validates
         that the retrieved price is a valid, positive number before returning.
 
@@ -708,14 +1371,29 @@ class System:
         Returns:
             list: A list containing the [price, asset_type, sector].
         """
-        # Initialize the yfinance Ticker object and increment the API call counter.
-        ticker = yf.Ticker(asset_name)
-        self.api_calls += 1 
+        # Fetch the ticker information through the gateway and count the call if it reached the API.
+        started = time.perf_counter()
+        asset_info, fetched = self.market_data.lookup(asset_name)
+        self.api_time += time.perf_counter() - started
+        self.api_calls += int(fetched)
 
         # Validate that the ticker object contains information and extract it.
-        if not ticker.info:
+        if not asset_info:
             raise ValueError(f"Asset '{asset_name}' not found or no data available.")
-        asset_info = ticker.info
+        return self.parse_asset_info(asset_name, asset_info)
+
+    def parse_asset_info(self, asset_name: str, asset_info: dict) -> list:
+        """
+        Extracts the price, type and sector of an asset from its yfinance info dictionary.
+        The price is chosen based on the market state and validated to be positive.
+
+        Args:
+            asset_name (str): The ticker symbol of the asset (e.g., 'AAPL').
+            asset_info (dict): The 'info' dictionary returned by yfinance for that ticker.
+
+        Returns:
+            list: A list containing the [price, asset_type, sector].
+        """
         market_state = asset_info.get("marketState", None)
         asset_price = None
         
@@ -734,6 +1412,45 @@ class System:
         sector = asset_info.get('sector', "N/A")
         asset_data = [asset_price, asset_type, sector]
         return asset_data 
+
+    @requires_login
+    def get_assets_data_api(self, asset_names: list) -> dict:
+        """
+        Retrieves live market data for many assets in one batch.
+
+        Each distinct ticker is requested once, and the requests run concurrently
+        through the market data gateway, which keeps them within its rate limit.
+        Failures are returned per ticker instead of aborting the whole batch.
+
+        Args:
+            asset_names (list): The ticker symbols to look up. Duplicates are fetched once.
+
+        Returns:
+            dict: A mapping of each ticker to its [price, asset_type, sector] list,
+            or to the exception raised while resolving it.
+        """
+        unique_names = list(dict.fromkeys(asset_names))
+        results = {}
+        if not unique_names:
+            return results
+
+        def _fetch(name):
+            fetched = False
+            try:
+                info, fetched = self.market_data.lookup(name)
+                if not info:
+                    raise ValueError(f"Asset '{name}' not found or no data available.")
+                return self.parse_asset_info(name, info), fetched
+            except Exception as error:
+                return error, fetched
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(16, len(unique_names))) as executor:
+            for name, (data, fetched) in zip(unique_names, executor.map(_fetch, unique_names)):
+                results[name] = data
+                self.api_calls += int(fetched)
+        self.api_time += time.perf_counter() - started
+        return results
     
     def get_asset_current_price(self, asset_name: str) -> float:
         """
@@ -755,19 +1472,28 @@ class System:
         asset_price = asset_data[0]
         return asset_price 
     
+    @profiled
     @requires_login
-    def get_portfolio_info(self, source: str) -> pd.DataFrame:
+    def get_portfolio_info(self, source: str, dtype_backend: str = 'numpy') -> pd.DataFrame:
         """
         Retrieves data for the logged-in user from a specified table and returns it as a Pandas DataFrame.
         If no records are found, it prints a message and returns an empty DataFrame.
 
+        The rows are streamed by the database with COPY and parsed column by column,
+        so no Python object is created per cell. NUMERIC columns arrive as float64 and
+        TIMESTAMP columns as datetime64, ready for vectorized math without casting.
+
         Args:
             source (str, optional): The table to fetch data from. Valid options are
                 'positions', 'transactions', or 'user_history'
+            dtype_backend (str, optional): 'numpy' for NumPy-backed float64/datetime64 columns,
+                or 'pyarrow' for Arrow-backed columns (pd.ArrowDtype). Defaults to 'numpy'.
         
         Returns:
             pd.DataFrame: A DataFrame containing the requested data, or an empty DataFrame.
         """
+        if dtype_backend not in ('numpy', 'pyarrow'):
+            raise ValueError(f"Invalid dtype backend '{dtype_backend}'. Please choose 'numpy' or 'pyarrow'.")
         
         if source == 'positions':
             table_name = 'positions'
@@ -778,20 +1504,262 @@ class System:
         else:
             raise ValueError(f"Invalid source '{source}'. Please choose from 'positions', 'transactions', or 'history'.")
 
-        query = f"SELECT * FROM {table_name} WHERE user_id = :user_id;"
-        params = {"user_id": self.user_id}
-        result_proxy = self.execute_query(query, params, fetch='proxy') 
-
-        column_names = list(result_proxy.keys())
-        results = result_proxy.fetchall()
-
-        if not results:
+        local_df = self._fetch_columnar(table_name, dtype_backend)
+        if local_df.empty:
             print(f"No records found in '{table_name}' for user '{self.user_name}'.")
             return pd.DataFrame()
-        
-        local_df = pd.DataFrame(results, columns=column_names)
+        return local_df
+
+    def _fetch_columnar(self, table_name: str, dtype_backend: str) -> pd.DataFrame:
+        """
+        Streams the logged-in user's rows of a table with COPY and parses them into typed columns.
+        pyarrow's CSV reader is used when it is installed (and is required for the 'pyarrow'
+        backend); otherwise the pandas C parser is used with the same column types.
+
+        Args:
+            table_name (str): The table to read.
+            dtype_backend (str): Either 'numpy' or 'pyarrow'.
+
+        Returns:
+            pd.DataFrame: The rows, typed according to TABLE_COLUMN_TYPES.
+        """
+        column_types = TABLE_COLUMN_TYPES[table_name]
+        if not self.dialect.supports_copy:
+            return self._fetch_typed_rows(table_name, dtype_backend)
+
+        buffer = io.BytesIO()
+        self.db_calls += 1
+        started = time.perf_counter()
+        raw_connection = self.select_engine(read_only=True).raw_connection()
+        try:
+            with raw_connection.cursor() as cursor:
+                select_query = cursor.mogrify(
+                    f"SELECT {', '.join(column_types)} FROM {table_name} WHERE user_id = %s", (self.user_id,)
+                ).decode()
+                cursor.copy_expert(f"COPY ({select_query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer)
+            raw_connection.commit()
+        finally:
+            raw_connection.close()
+            self.db_time += time.perf_counter() - started
+        buffer.seek(0)
+
+        try:
+            import pyarrow.csv as pa_csv
+        except ImportError:
+            if dtype_backend == 'pyarrow':
+                raise ImportError("The 'pyarrow' dtype backend requires the pyarrow package.")
+            pa_csv = None
+
+        if pa_csv is not None:
+            schema = self._arrow_schema(table_name, exact_numeric=False)
+            convert_options = pa_csv.ConvertOptions(column_types=schema, strings_can_be_null=True, quoted_strings_can_be_null=False)
+            table = pa_csv.read_csv(buffer, convert_options=convert_options)
+            if dtype_backend == 'pyarrow':
+                return table.to_pandas(types_mapper=pd.ArrowDtype)
+            return table.to_pandas()
+
+        dtypes = {c: 'Int64' if k == 'integer' else 'float64' for c, k in column_types.items() if k == 'integer' or k.startswith('numeric')}
+        dates = [c for c, k in column_types.items() if k == 'timestamp']
+        return pd.read_csv(buffer, dtype=dtypes, parse_dates=dates)
+
+    def _fetch_typed_rows(self, table_name: str, dtype_backend: str) -> pd.DataFrame:
+        """
+        Fallback of _fetch_columnar for backends without COPY: fetches the logged-in user's rows
+        through the driver and casts them to the same column types.
+
+        Args:
+            table_name (str): The table to read.
+            dtype_backend (str): Either 'numpy' or 'pyarrow'.
+
+        Returns:
+            pd.DataFrame: The rows, typed according to TABLE_COLUMN_TYPES.
+        """
+        column_types = TABLE_COLUMN_TYPES[table_name]
+        local_df = self.query_frame(
+            f"SELECT {', '.join(column_types)} FROM {table_name} WHERE user_id = :user_id;", {"user_id": self.user_id}
+        )
+        for column, kind in column_types.items():
+            if kind.startswith('numeric'):
+                local_df[column] = local_df[column].astype('float64')
+            elif kind == 'integer':
+                local_df[column] = local_df[column].astype('Int64')
+            elif kind == 'timestamp':
+                local_df[column] = pd.to_datetime(local_df[column])
+        if dtype_backend == 'pyarrow':
+            import pyarrow as pa
+            return pa.Table.from_pandas(local_df, preserve_index=False).to_pandas(types_mapper=pd.ArrowDtype)
         return local_df
     
+    def query_frame(self, query: str, params=None) -> pd.DataFrame:
+        """
+        Runs a read-only query and returns its result as a Pandas DataFrame with the query's column names.
+        Meant for aggregate queries whose results are small.
+
+        Args:
+            query (str): A valid SQL query string with named parameters (e.g., :name).
+            params (dict, optional): A mapping of parameter names to values. Defaults to {}.
+
+        Returns:
+            pd.DataFrame: The rows returned by the query (empty but with columns if there are none).
+        """
+        self.db_calls += 1
+        started = time.perf_counter()
+        try:
+            with self.select_engine(read_only=True).connect() as conn:
+                result = conn.execute(text(query), params or {})
+                return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+        finally:
+            self.db_time += time.perf_counter() - started
+
+    @profiled
+    @requires_login
+    def get_pnl_by_month(self) -> pd.DataFrame:
+        """
+        Computes the realized profit and loss of the logged-in user per calendar month.
+        The aggregation, including the running total, is done by the database over the
+        'transactions' table, so only one row per month is transferred.
+
+        Args:
+            None
+
+        Returns:
+            pd.DataFrame: Columns month, trades, wins, invested, realized_pnl and cumulative_pnl.
+        """
+        month = self.dialect.month('close_datetime')
+        query = f"""
+        SELECT
+            {month} AS month,
+            COUNT(*) AS trades,
+            COUNT(*) FILTER (WHERE loss_profit > 0) AS wins,
+            CAST(SUM(position_amount) AS DOUBLE PRECISION) AS invested,
+            CAST(SUM(loss_profit) AS DOUBLE PRECISION) AS realized_pnl,
+            CAST(SUM(SUM(loss_profit)) OVER (ORDER BY {month}) AS DOUBLE PRECISION) AS cumulative_pnl
+        FROM transactions
+        WHERE user_id = :user_id
+        GROUP BY {month}
+        ORDER BY month;
+        """
+        local_df = self.query_frame(query, {"user_id": self.user_id})
+        local_df['month'] = pd.to_datetime(local_df['month'])  # SQLite returns the month as text
+        return local_df
+
+    @profiled
+    @requires_login
+    def get_allocation(self, by: str = 'sector') -> pd.DataFrame:
+        """
+        Computes how the logged-in user's open positions are allocated by sector or asset type.
+
+        Args:
+            by (str, optional): Either 'sector' or 'asset_type'. Defaults to 'sector'.
+
+        Returns:
+            pd.DataFrame: Columns <by>, positions, invested and weight (share of the total invested amount),
+            sorted by the invested amount.
+        """
+        if by not in ('sector', 'asset_type'):
+            raise ValueError(f"Invalid allocation key '{by}'. Please choose 'sector' or 'asset_type'.")
+
+        query = f"""
+        SELECT
+            {by},
+            COUNT(*) AS positions,
+            CAST(SUM(position_amount) AS DOUBLE PRECISION) AS invested,
+            CAST(SUM(position_amount) AS DOUBLE PRECISION) / SUM(SUM(position_amount)) OVER () AS weight
+        FROM positions
+        WHERE user_id = :user_id
+        GROUP BY {by}
+        ORDER BY invested DESC;
+        """
+        return self.query_frame(query, {"user_id": self.user_id})
+
+    @profiled
+    @requires_login
+    def get_ticker_stats(self) -> pd.DataFrame:
+        """
+        Computes trading statistics per ticker from the logged-in user's closed trades.
+
+        Args:
+            None
+
+        Returns:
+            pd.DataFrame: Columns position_name, trades, wins, win_rate, total_pnl, avg_pnl,
+            best_pnl, worst_pnl and avg_holding_days, sorted by total_pnl.
+        """
+        holding_seconds = self.dialect.seconds_between('close_datetime', 'open_datetime')
+        query = f"""
+        SELECT
+            position_name,
+            COUNT(*) AS trades,
+            COUNT(*) FILTER (WHERE loss_profit > 0) AS wins,
+            CAST(COUNT(*) FILTER (WHERE loss_profit > 0) AS DOUBLE PRECISION) / COUNT(*) AS win_rate,
+            CAST(SUM(loss_profit) AS DOUBLE PRECISION) AS total_pnl,
+            CAST(AVG(loss_profit) AS DOUBLE PRECISION) AS avg_pnl,
+            CAST(MAX(loss_profit) AS DOUBLE PRECISION) AS best_pnl,
+            CAST(MIN(loss_profit) AS DOUBLE PRECISION) AS worst_pnl,
+            CAST(AVG({holding_seconds}) / 86400 AS DOUBLE PRECISION) AS avg_holding_days
+        FROM transactions
+        WHERE user_id = :user_id
+        GROUP BY position_name
+        ORDER BY total_pnl DESC;
+        """
+        return self.query_frame(query, {"user_id": self.user_id})
+
+    @profiled
+    @requires_login
+    def get_activity_by_month(self) -> pd.DataFrame:
+        """
+        Summarizes the logged-in user's opening and closing activity per calendar month from 'user_history'.
+
+        Args:
+            None
+
+        Returns:
+            pd.DataFrame: Columns month, opened, closed, amount_opened and amount_closed.
+        """
+        month = self.dialect.month('COALESCE(close_datetime, open_datetime)')
+        query = f"""
+        SELECT
+            {month} AS month,
+            COUNT(*) FILTER (WHERE state = 'OPEN') AS opened,
+            COUNT(*) FILTER (WHERE state = 'CLOSED') AS closed,
+            CAST(COALESCE(SUM(position_amount) FILTER (WHERE state = 'OPEN'), 0) AS DOUBLE PRECISION) AS amount_opened,
+            CAST(COALESCE(SUM(position_amount) FILTER (WHERE state = 'CLOSED'), 0) AS DOUBLE PRECISION) AS amount_closed
+        FROM user_history
+        WHERE user_id = :user_id
+        GROUP BY {month}
+        ORDER BY month;
+        """
+        local_df = self.query_frame(query, {"user_id": self.user_id})
+        local_df['month'] = pd.to_datetime(local_df['month'])  # SQLite returns the month as text
+        return local_df
+
+    @profiled
+    @requires_login
+    def get_risk_metrics(self, risk_model: RiskModel, confidence: float = 0.95, horizon_days: int = 1) -> dict:
+        """
+        Computes volatility, correlation, Value at Risk and per-position risk contribution
+        for the logged-in user's open positions.
+        The positions come from the in-memory position book, so no database call is made.
+
+        Args:
+            risk_model (RiskModel): A model built over a local history of returns
+                (e.g. RiskModel.from_price_file('prices.csv')). Reuse the same model
+                between calls to benefit from its cached matrices.
+            confidence (float, optional): Confidence level of the Value at Risk. Defaults to 0.95.
+            horizon_days (int, optional): VaR horizon in days. Defaults to 1.
+
+        Returns:
+            dict: The metrics described in RiskModel.report.
+        """
+        book = self.get_position_book()
+        positions = pd.DataFrame(
+            [(r.position_id, r.position_name, r.asset_share, r.open_price) for r in book.get_all()],
+            columns=['position_id', 'position_name', 'asset_share', 'open_price']
+        )
+        if positions.empty:
+            raise ValueError(f"User '{self.user_name}' has no open positions.")
+        return risk_model.report(positions, confidence=confidence, horizon_days=horizon_days)
+
     @requires_login
     def show_db_api_calls(self):
         """
@@ -812,3 +1780,261 @@ class System:
         # Reset the counters for database and API calls
         self.api_calls = 0
         self.db_calls = 0
+
+    @profiled
+    def export_bulk(self, directory: str, user_ids: list = None, tables: list = None, file_format: str = 'csv') -> dict:
+        """
+        Exports whole tables to files using PostgreSQL COPY streaming.
+
+        Rows are streamed by the server straight into the target file, so no Python
+        object is created per row and memory stays bounded no matter how large the
+        table is. For Parquet, the COPY output is first spooled to a temporary file
+        on disk and then converted block by block with pyarrow.
+
+        Args:
+            directory (str): The folder where one file per table is written (e.g. 'positions.csv').
+            user_ids (list, optional): Only export rows belonging to these user IDs.
+                Defaults to None, which exports all users.
+            tables (list, optional): Any of 'users', 'positions', 'transactions' or 'history'.
+                Defaults to None, which exports all four.
+            file_format (str, optional): Either 'csv' or 'parquet'. Defaults to 'csv'.
+
+        Returns:
+            dict: A mapping of each exported source name to the path of its file.
+        """
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError(f"Invalid file format '{file_format}'. Please choose 'csv' or 'parquet'.")
+        if not self.dialect.supports_copy:
+            raise RuntimeError(f"Bulk COPY transfers are not supported by the {self.dialect.name} backend.")
+        sources = self._bulk_sources(tables)
+        os.makedirs(directory, exist_ok=True)
+        exported = {}
+
+        raw_connection = self.select_engine(read_only=True).raw_connection()
+        try:
+            with raw_connection.cursor() as cursor:
+                for source in sources:
+                    table_name = BULK_TABLES[source]
+                    columns = ", ".join(TABLE_COLUMN_TYPES[table_name])
+                    select_query = f"SELECT {columns} FROM {table_name}"
+                    if user_ids is not None:
+                        select_query = cursor.mogrify(f"{select_query} WHERE user_id = ANY(%s)", (list(user_ids),)).decode()
+                    copy_query = f"COPY ({select_query}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+                    file_path = os.path.join(directory, f"{source}.{file_format}")
+
+                    if file_format == 'csv':
+                        with open(file_path, 'w', newline='', encoding='utf-8') as out_file:
+                            cursor.copy_expert(copy_query, out_file)
+                    else:
+                        with tempfile.TemporaryFile() as spool:
+                            cursor.copy_expert(copy_query, spool)
+                            spool.seek(0)
+                            self._csv_to_parquet(spool, file_path, table_name)
+                    self.db_calls += 1
+                    exported[source] = file_path
+                    print(f"Exported {cursor.rowcount} rows from '{table_name}' to {file_path}")
+            raw_connection.commit()
+        finally:
+            raw_connection.close()
+        return exported
+
+    @profiled
+    def import_bulk(self, directory: str, user_ids: list = None, tables: list = None, file_format: str = 'csv', skip_existing: bool = False) -> dict:
+        """
+        Imports files written by `export_bulk` back into the database using COPY streaming.
+
+        All tables are loaded in one transaction, so the import either fully succeeds or
+        leaves the database untouched. CSV files are streamed to the server as they are;
+        Parquet files are sent in record batches, so memory stays bounded. When rows need
+        filtering (a user subset or skipping rows that already exist), the data is copied
+        into a temporary staging table first and moved over with a single INSERT ... SELECT.
+
+        Args:
+            directory (str): The folder that holds one file per table (e.g. 'positions.csv').
+            user_ids (list, optional): Only import rows belonging to these user IDs.
+                Defaults to None, which imports every row.
+            tables (list, optional): Any of 'users', 'positions', 'transactions' or 'history'.
+                Defaults to None, which imports every table that has a file in the folder.
+            file_format (str, optional): Either 'csv' or 'parquet'. Defaults to 'csv'.
+            skip_existing (bool, optional): If True, rows whose primary key already exists
+                are skipped instead of failing the import. Defaults to False.
+
+        Returns:
+            dict: A mapping of each imported source name to the number of rows inserted.
+        """
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError(f"Invalid file format '{file_format}'. Please choose 'csv' or 'parquet'.")
+        if not self.dialect.supports_copy:
+            raise RuntimeError(f"Bulk COPY transfers are not supported by the {self.dialect.name} backend.")
+        sources = self._bulk_sources(tables)
+        if tables is None:
+            sources = [s for s in sources if os.path.exists(os.path.join(directory, f"{s}.{file_format}"))]
+        imported = {}
+
+        self.write_pending = True
+        raw_connection = self.engine.raw_connection()
+        try:
+            with raw_connection.cursor() as cursor:
+                for source in sources:
+                    table_name = BULK_TABLES[source]
+                    file_path = os.path.join(directory, f"{source}.{file_format}")
+                    if not os.path.exists(file_path):
+                        raise ValueError(f"File '{file_path}' for '{source}' was not found.")
+
+                    use_staging = user_ids is not None or skip_existing
+                    target_table = table_name
+                    if use_staging:
+                        target_table = f"staging_{table_name}"
+                        cursor.execute(f"CREATE TEMP TABLE {target_table} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP;")
+
+                    if file_format == 'csv':
+                        with open(file_path, 'r', newline='', encoding='utf-8') as in_file:
+                            columns = next(csv.reader([in_file.readline()]))  # The rest of the file is streamed as is
+                            self._validate_bulk_columns(table_name, columns)
+                            copy_query = f"COPY {target_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+                            cursor.copy_expert(copy_query, in_file)
+                        row_count = cursor.rowcount
+                    else:
+                        row_count = self._copy_parquet_batches(cursor, file_path, table_name, target_table)
+                    self.db_calls += 1
+
+                    if use_staging:
+                        columns = ", ".join(TABLE_COLUMN_TYPES[table_name])
+                        insert_query = f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {target_table}"
+                        if user_ids is not None:
+                            insert_query = cursor.mogrify(f"{insert_query} WHERE user_id = ANY(%s)", (list(user_ids),)).decode()
+                        if skip_existing:
+                            insert_query += " ON CONFLICT DO NOTHING"
+                        cursor.execute(insert_query)
+                        self.db_calls += 1
+                        row_count = cursor.rowcount
+
+                    imported[source] = row_count
+                    print(f"Imported {row_count} rows into '{table_name}' from {file_path}")
+
+                if 'history' in imported:
+                    # Explicit action_ids were copied in, so move the SERIAL sequence past them.
+                    cursor.execute("""
+                    SELECT setval(pg_get_serial_sequence('user_history', 'action_id'), COALESCE(MAX(action_id), 0) + 1, false)
+                    FROM user_history;
+                    """)
+                    self.db_calls += 1
+            raw_connection.commit()
+        except Exception:
+            raw_connection.rollback()
+            raise
+        finally:
+            raw_connection.close()
+        return imported
+
+    def _bulk_sources(self, tables: list = None) -> list:
+        """
+        Validates the requested bulk sources and returns them in foreign key order.
+
+        Args:
+            tables (list, optional): Any of 'users', 'positions', 'transactions' or 'history'.
+                Defaults to None, which selects all of them.
+
+        Returns:
+            list: The selected source names, parents first.
+        """
+        if tables is None:
+            return list(BULK_TABLES)
+        invalid = [t for t in tables if t not in BULK_TABLES]
+        if invalid:
+            raise ValueError(f"Invalid tables {invalid}. Please choose from {list(BULK_TABLES)}.")
+        return [t for t in BULK_TABLES if t in tables]
+
+    def _validate_bulk_columns(self, table_name: str, columns: list):
+        """
+        Checks that every column of an import file exists in the target table,
+        since the names are placed directly into the COPY statement.
+
+        Args:
+            table_name (str): The name of the target table.
+            columns (list): The column names read from the file.
+        """
+        unknown = [c for c in columns if c not in TABLE_COLUMN_TYPES[table_name]]
+        if unknown:
+            raise ValueError(f"Columns {unknown} do not exist in table '{table_name}'.")
+
+    def _arrow_schema(self, table_name: str, columns: list = None, exact_numeric: bool = True):
+        """
+        Builds the pyarrow schema of a table from TABLE_COLUMN_TYPES.
+
+        Args:
+            table_name (str): The name of the table.
+            columns (list, optional): Restrict the schema to these columns. Defaults to all.
+            exact_numeric (bool, optional): Keep NUMERIC columns as exact decimals (for backups)
+                instead of float64 (for analysis). Defaults to True.
+
+        Returns:
+            pyarrow.Schema: The schema of the table.
+        """
+        import pyarrow as pa
+
+        fields = []
+        for column, kind in TABLE_COLUMN_TYPES[table_name].items():
+            if columns is not None and column not in columns:
+                continue
+            if kind.startswith('numeric') and not exact_numeric:
+                arrow_type = pa.float64()
+            elif kind.startswith('numeric'):
+                precision, scale = map(int, kind[len('numeric('):-1].split(','))
+                arrow_type = pa.decimal128(precision, scale)
+            elif kind == 'integer':
+                arrow_type = pa.int64()
+            elif kind == 'timestamp':
+                arrow_type = pa.timestamp('s')
+            else:
+                arrow_type = pa.string()
+            fields.append(pa.field(column, arrow_type))
+        return pa.schema(fields)
+
+    def _csv_to_parquet(self, csv_file, file_path: str, table_name: str):
+        """
+        Converts a COPY CSV stream into a Parquet file one block at a time.
+
+        Args:
+            csv_file (file): A binary file object positioned at the CSV header.
+            file_path (str): The path of the Parquet file to write.
+            table_name (str): The table the CSV was exported from.
+        """
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+
+        schema = self._arrow_schema(table_name)
+        convert_options = pa_csv.ConvertOptions(column_types=schema, strings_can_be_null=True, quoted_strings_can_be_null=False)
+        reader = pa_csv.open_csv(csv_file, convert_options=convert_options)
+        with pq.ParquetWriter(file_path, schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+
+    def _copy_parquet_batches(self, cursor, file_path: str, table_name: str, target_table: str):
+        """
+        Streams a Parquet file into a table with one COPY per record batch.
+
+        Args:
+            cursor (psycopg2.extensions.cursor): An open cursor inside the import transaction.
+            file_path (str): The path of the Parquet file to read.
+            table_name (str): The table the file belongs to, used to validate its columns.
+            target_table (str): The table (or staging table) that receives the rows.
+
+        Returns:
+            int: The number of rows copied.
+        """
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(file_path)
+        columns = parquet_file.schema_arrow.names
+        self._validate_bulk_columns(table_name, columns)
+        copy_query = f"COPY {target_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        total_rows = 0
+        for batch in parquet_file.iter_batches(batch_size=100_000):
+            buffer = io.BytesIO()
+            pa_csv.write_csv(batch, buffer, pa_csv.WriteOptions(include_header=False))
+            buffer.seek(0)
+            cursor.copy_expert(copy_query, buffer)
+            total_rows += cursor.rowcount
+        return total_rows
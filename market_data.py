@@ -0,0 +1,392 @@
+import os
+import random
+import threading
+import time
+import yfinance as yf
+
+
+def fetch_yfinance_info(symbol: str) -> dict:
+    """
+    Fetches the raw yfinance 'info' dictionary of a ticker. This is the gateway's default fetcher.
+
+    Args:
+        symbol (str): The ticker symbol (e.g., 'AAPL').
+
+    Returns:
+        dict: The info dictionary (empty if yfinance knows nothing about the symbol).
+    """
+    return yf.Ticker(symbol).info
+
+
+class _InFlight:
+    """
+    A fetch that is currently running. Callers asking for the same symbol wait on it
+    instead of starting a request of their own.
+    """
+
+    __slots__ = ('event', 'result', 'error', 'background')
+
+    def __init__(self, background: bool = False):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.background = background  # Cleared as soon as a foreground caller waits on the fetch
+
+
+class MarketDataGateway:
+    """
+    Thread-safe gateway in front of the market data API.
+
+    - Single flight: concurrent requests for the same symbol are coalesced into one fetch,
+      whose result (or error) is shared by every waiting caller.
+    - Rate limiting: every upstream fetch takes a token from a token bucket, so bursts are
+      smoothed out to 'rate' requests per second with at most 'burst' at once. Background
+      fetches (e.g. of the price refresher) have a lower priority: they leave 'reserve' tokens
+      in the bucket, so user requests never queue behind them.
+    - Backoff: fetches that fail because of upstream throttling are retried with exponential,
+      jittered backoff. Other errors are returned to the callers immediately.
+    - Caching (off until enable_cache is called, e.g. by the price refresher): fetched quotes are
+      kept for a time that depends on the market state. Quotes of a REGULAR (open) or PRE market
+      expire quickly, so no quote fetched before the open is served long after it, while
+      CLOSED/POST quotes, which are based on the previous close, are kept much longer. The
+      cache holds at most 'cache_size' symbols.
+    - Metrics: request, fetch, cache and coalescing counts, queue depth and wait times are
+      exposed through metrics().
+    """
+
+    def __init__(self, fetcher=None, rate: float = 5.0, burst: int = 10, max_retries: int = 4,
+                 base_backoff: float = 0.5, max_backoff: float = 30.0, regular_ttl: float = 15.0,
+                 closed_ttl: float = 300.0, cache_enabled: bool = False, reserve: int = None,
+                 cache_size: int = 1024):
+        """
+        Initializes a new MarketDataGateway instance.
+
+        Args:
+            fetcher (callable, optional): A function taking a symbol and returning its info dict.
+                Defaults to fetch_yfinance_info.
+            rate (float, optional): Tokens added to the bucket per second. Defaults to 5.0.
+            burst (int, optional): Capacity of the bucket. Defaults to 10.
+            max_retries (int, optional): Retries of a throttled fetch before giving up. Defaults to 4.
+            base_backoff (float, optional): Backoff of the first retry in seconds. Defaults to 0.5.
+            max_backoff (float, optional): Upper bound of a single backoff in seconds. Defaults to 30.0.
+            regular_ttl (float, optional): Seconds a quote of an open (REGULAR) or pre-market (PRE)
+                stays cached. Defaults to 15.0.
+            closed_ttl (float, optional): Seconds a quote of a closed or post-market stays cached.
+                Defaults to 300.0. A TTL of 0 or less means such quotes are never cached.
+            cache_enabled (bool, optional): Whether quotes are cached from the start. Defaults to False,
+                so every request fetches a fresh quote until enable_cache is called.
+            reserve (int, optional): Tokens that background fetches must leave in the bucket for
+                user requests. Defaults to None, which reserves half of the burst (rounded down).
+            cache_size (int, optional): The most symbols kept in the cache. Defaults to 1024.
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate must be positive and burst at least 1.")
+        if reserve is None:
+            reserve = burst // 2  # 0 for a burst of 1, which leaves no room for a reserve
+        if not 0 <= reserve < burst:
+            raise ValueError("Reserve must be at least 0 and lower than burst.")
+        self._fetcher = fetcher or fetch_yfinance_info
+        self._rate = rate
+        self._burst = burst
+        self._max_retries = max_retries
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._regular_ttl = regular_ttl
+        self._closed_ttl = closed_ttl
+        self._cache_enabled = cache_enabled
+        self._reserve = reserve
+        self._cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._cache = {}  # symbol -> (info, expires_at)
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+
+        self._requests = 0
+        self._cache_hits = 0
+        self._fetches = 0
+        self._coalesced = 0
+        self._throttled = 0
+        self._errors = 0
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def fetch_info(self, symbol: str, use_cache: bool = True, background: bool = False) -> dict:
+        """
+        Retrieves the info dictionary of a symbol, from the cache if it is still fresh,
+        otherwise sharing the fetch with any concurrent caller that asks for the same symbol.
+
+        Args:
+            symbol (str): The ticker symbol (e.g., 'AAPL').
+            use_cache (bool, optional): Set to False to always fetch a fresh quote
+                (the result still refreshes the cache). Defaults to True.
+            background (bool, optional): Set to True for fetches nobody is waiting on, which then
+                only use tokens above the reserve. Defaults to False.
+
+        Returns:
+            dict: The info dictionary returned by the fetcher.
+        """
+        return self.lookup(symbol, use_cache, background)[0]
+
+    def lookup(self, symbol: str, use_cache: bool = True, background: bool = False) -> tuple:
+        """
+        Same as fetch_info, but also tells whether this call sent a request to the market data API.
+
+        Args:
+            symbol (str): The ticker symbol (e.g., 'AAPL').
+            use_cache (bool, optional): Set to False to always fetch a fresh quote
+                (the result still refreshes the cache). Defaults to True.
+            background (bool, optional): Set to True for fetches nobody is waiting on, which then
+                only use tokens above the reserve. Defaults to False.
+
+        Returns:
+            tuple: (info, fetched) where info is the info dictionary and fetched is True only if
+            this call ran the fetcher (False for cache hits and for calls that joined another fetch).
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._requests += 1
+            cached = self._cache.get(symbol)
+            if use_cache and self._cache_enabled and cached is not None and cached[1] > started:
+                self._cache_hits += 1
+                return cached[0], False
+            call = self._in_flight.get(symbol)
+            leader = call is None
+            if leader:
+                call = _InFlight(background)
+                self._in_flight[symbol] = call
+            else:
+                self._coalesced += 1
+                if not background:
+                    call.background = False  # A user now waits on this fetch, so it must not yield
+            self._enter_queue()
+
+        if leader:
+            try:
+                call.result = self._fetch_with_backoff(symbol, started, call)
+            except Exception as error:
+                call.error = error
+            finally:
+                with self._lock:
+                    del self._in_flight[symbol]
+                    if self._cache_enabled and call.error is None and call.result:
+                        self._store(symbol, call.result)
+                call.event.set()
+        else:
+            call.event.wait()
+            self._leave_queue(started)
+
+        if call.error is not None:
+            raise call.error
+        return call.result, leader
+
+    def _store(self, symbol: str, info: dict):
+        """
+        Caches a quote for its time to live, evicting expired and then the oldest entries
+        once the cache holds more than 'cache_size' symbols. Must be called with the lock held.
+
+        Args:
+            symbol (str): The ticker symbol.
+            info (dict): The info dictionary to cache.
+        """
+        ttl = self.ttl_for(info)
+        self._cache.pop(symbol, None)  # Re-inserted at the end, so the dict stays in storing order
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        self._cache[symbol] = (info, now + ttl)
+        if len(self._cache) > self._cache_size:
+            for expired in [s for s, (_, expires_at) in self._cache.items() if expires_at <= now]:
+                del self._cache[expired]
+            while len(self._cache) > self._cache_size:
+                del self._cache[next(iter(self._cache))]
+
+    def enable_cache(self):
+        """
+        Turns on quote caching. Called by the price refresher, which keeps the cached quotes fresh.
+        """
+        with self._lock:
+            self._cache_enabled = True
+
+    def ttl_for(self, info: dict) -> float:
+        """
+        Tells how long a quote may be cached, based on its market state. Pre-market quotes
+        use the short TTL, since the market may open at any moment.
+
+        Args:
+            info (dict): The info dictionary of a symbol.
+
+        Returns:
+            float: The time to live in seconds.
+        """
+        return self._regular_ttl if info.get('marketState') in ('REGULAR', 'PRE') else self._closed_ttl
+
+    def expires_in(self, symbol: str):
+        """
+        Tells how long the cached quote of a symbol remains fresh.
+
+        Args:
+            symbol (str): The ticker symbol.
+
+        Returns:
+            float | None: Seconds until expiry (negative once expired), or None if the symbol is not cached.
+        """
+        with self._lock:
+            cached = self._cache.get(symbol)
+        if cached is None:
+            return None
+        return cached[1] - time.monotonic()
+
+    def _fetch_with_backoff(self, symbol: str, started: float, call: _InFlight) -> dict:
+        """
+        Runs the fetcher once a token is available, retrying throttled fetches with jittered backoff.
+
+        Args:
+            symbol (str): The ticker symbol.
+            started (float): When the caller entered the gateway (time.monotonic).
+            call (_InFlight): The shared fetch, which tells whether it still runs in the background.
+
+        Returns:
+            dict: The info dictionary returned by the fetcher.
+        """
+        attempt = 0
+        waiting = True
+        try:
+            while True:
+                self._acquire_token(call)
+                if waiting:
+                    self._leave_queue(started)
+                    waiting = False
+                with self._lock:
+                    self._fetches += 1
+                try:
+                    return self._fetcher(symbol)
+                except Exception as error:
+                    if not self._is_throttle_error(error) or attempt >= self._max_retries:
+                        with self._lock:
+                            self._errors += 1
+                        raise
+                    with self._lock:
+                        self._throttled += 1
+                    delay = min(self._max_backoff, self._base_backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    attempt += 1
+                    time.sleep(delay)
+        finally:
+            if waiting:
+                self._leave_queue(started)
+
+    def _acquire_token(self, call: _InFlight):
+        """
+        Blocks until the token bucket holds a token, then takes it. Background fetches
+        wait until a token is available on top of the reserve.
+
+        Args:
+            call (_InFlight): The fetch that needs the token.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+                self._last_refill = now
+                needed = 1 + self._reserve if call.background else 1
+                if self._tokens >= needed:
+                    self._tokens -= 1
+                    return
+                # Background fetches re-check at least once per token, in case a user request joined them.
+                wait = min(needed - self._tokens, 1) / self._rate
+            time.sleep(wait)
+
+    def _is_throttle_error(self, error: Exception) -> bool:
+        """
+        Tells whether an error means the upstream API is throttling us.
+
+        Args:
+            error (Exception): The error raised by the fetcher.
+
+        Returns:
+            bool: True for rate limit errors (yfinance's YFRateLimitError or HTTP 429).
+        """
+        if type(error).__name__ == 'YFRateLimitError':
+            return True
+        message = str(error).lower()
+        return '429' in message or 'too many requests' in message or 'rate limit' in message
+
+    def _enter_queue(self):
+        """
+        Counts a caller as waiting. Must be called with the lock held.
+        """
+        self._queue_depth += 1
+        self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+
+    def _leave_queue(self, started: float):
+        """
+        Counts a caller as no longer waiting and records how long it waited.
+
+        Args:
+            started (float): When the caller entered the gateway (time.monotonic).
+        """
+        waited = time.monotonic() - started
+        with self._lock:
+            self._queue_depth -= 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+    def metrics(self) -> dict:
+        """
+        Retrieves the gateway's counters.
+
+        Returns:
+            dict: requests, cache_hits, cached_symbols, fetches, coalesced, throttled
+            (retried fetches), errors, in_flight, queue_depth, max_queue_depth, total_wait,
+            avg_wait and max_wait
+            (wait times in seconds, measured until a token was granted or a shared
+            fetch finished).
+        """
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'cache_hits': self._cache_hits,
+                'cached_symbols': len(self._cache),
+                'fetches': self._fetches,
+                'coalesced': self._coalesced,
+                'throttled': self._throttled,
+                'errors': self._errors,
+                'in_flight': len(self._in_flight),
+                'queue_depth': self._queue_depth,
+                'max_queue_depth': self._max_queue_depth,
+                'total_wait': self._total_wait,
+                'avg_wait': self._total_wait / self._requests if self._requests else 0.0,
+                'max_wait': self._max_wait,
+            }
+
+
+_default_gateway = None
+_default_gateway_lock = threading.Lock()
+
+
+def get_default_gateway() -> MarketDataGateway:
+    """
+    Retrieves the process-wide gateway shared by all System instances, creating it on first use.
+    Its limits can be set with the MARKET_DATA_RATE, MARKET_DATA_BURST and MARKET_DATA_RESERVE
+    environment variables, and its cache lifetimes with MARKET_DATA_TTL_REGULAR and
+    MARKET_DATA_TTL_CLOSED. Caching is off unless MARKET_DATA_CACHE is set or the price
+    refresher is started.
+
+    Returns:
+        MarketDataGateway: The shared gateway.
+    """
+    global _default_gateway
+    with _default_gateway_lock:
+        if _default_gateway is None:
+            _default_gateway = MarketDataGateway(
+                rate=float(os.getenv('MARKET_DATA_RATE', '5')),
+                burst=int(os.getenv('MARKET_DATA_BURST', '10')),
+                reserve=int(os.getenv('MARKET_DATA_RESERVE')) if os.getenv('MARKET_DATA_RESERVE') else None,
+                regular_ttl=float(os.getenv('MARKET_DATA_TTL_REGULAR', '15')),
+                closed_ttl=float(os.getenv('MARKET_DATA_TTL_CLOSED', '300')),
+                cache_enabled=os.getenv('MARKET_DATA_CACHE', '').lower() in ('1', 'true', 'yes')
+            )
+        return _default_gateway
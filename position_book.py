@@ -0,0 +1,188 @@
+import threading
+
+
+class PositionRecord:
+    """
+    A compact, in-memory copy of a single row of the 'positions' table.
+
+    The record uses __slots__ so thousands of positions take little memory, and it
+    can be indexed like the database row it was built from (record[0] is the
+    position_id, record[2] the position_name, and so on), which lets it be passed
+    to the same System helpers that work with SQLAlchemy rows.
+    """
+
+    __slots__ = ('position_id', 'user_id', 'position_name', 'position_amount', 'open_price',
+                 'asset_share', 'asset_type', 'sector', 'open_datetime')
+
+    def __init__(self, position_id: str, user_id: str, position_name: str, position_amount, open_price,
+                 asset_share, asset_type: str, sector: str, open_datetime):
+        """
+        Initializes a new PositionRecord instance.
+
+        Args:
+            position_id (str): The unique identifier of the position.
+            user_id (str): The ID of the user who owns the position.
+            position_name (str): The ticker of the asset.
+            position_amount (Decimal | float): The invested amount.
+            open_price (Decimal | float): The asset price when the position was opened.
+            asset_share (Decimal | float): The number of shares held.
+            asset_type (str): The asset type (e.g., 'EQUITY').
+            sector (str): The sector of the asset.
+            open_datetime (datetime.datetime): When the position was opened.
+        """
+        self.position_id = position_id
+        self.user_id = user_id
+        self.position_name = position_name
+        self.position_amount = position_amount
+        self.open_price = open_price
+        self.asset_share = asset_share
+        self.asset_type = asset_type
+        self.sector = sector
+        self.open_datetime = open_datetime
+
+    @classmethod
+    def from_row(cls, row) -> 'PositionRecord':
+        """
+        Builds a record from a 'positions' row selected in table column order.
+
+        Args:
+            row (tuple): A row with all 9 columns of the 'positions' table.
+
+        Returns:
+            PositionRecord: The new record.
+        """
+        return cls(*row[:9])
+
+    def __getitem__(self, index: int):
+        return getattr(self, self.__slots__[index])
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"PositionRecord({self.position_id!r}, {self.position_name!r}, {self.position_amount!r})"
+
+
+class PositionBook:
+    """
+    Holds the open positions of one logged-in user in memory.
+
+    Positions are indexed by position_id and by ticker, so single lookups and
+    "all positions of an asset" lookups never need a database round trip. The
+    book is loaded once at login and then kept in sync by the System whenever a
+    transaction that opens or closes positions commits. A lock guards the indexes,
+    since change notifications from other processes patch the book from a
+    background thread.
+    """
+
+    def __init__(self, user_id: str):
+        """
+        Initializes an empty PositionBook.
+
+        Args:
+            user_id (str): The ID of the user whose positions are held.
+        """
+        self._user_id = user_id
+        self._by_id = {}
+        self._by_ticker = {}
+        self._lock = threading.RLock()
+
+    def load(self, rows):
+        """
+        Replaces the content of the book with the given rows.
+
+        Args:
+            rows (list): Rows of the 'positions' table in column order.
+        """
+        with self._lock:
+            self._by_id = {}
+            self._by_ticker = {}
+            for row in rows:
+                self.add(row)
+
+    def add(self, row) -> PositionRecord:
+        """
+        Adds a position to the book.
+
+        Args:
+            row (tuple | PositionRecord): A 'positions' row in column order.
+
+        Returns:
+            PositionRecord: The stored record.
+        """
+        record = row if isinstance(row, PositionRecord) else PositionRecord.from_row(row)
+        with self._lock:
+            self._by_id[record.position_id] = record
+            # A dict keeps the tickers' positions in insertion (opening) order and allows O(1) removals.
+            self._by_ticker.setdefault(record.position_name, {})[record.position_id] = record
+        return record
+
+    def remove(self, position_id: str):
+        """
+        Removes a position from the book. Unknown IDs are ignored.
+
+        Args:
+            position_id (str): The ID of the position to remove.
+        """
+        with self._lock:
+            record = self._by_id.pop(position_id, None)
+            if record is None:
+                return
+            ticker_positions = self._by_ticker.get(record.position_name)
+            if ticker_positions is not None:
+                ticker_positions.pop(position_id, None)
+                if not ticker_positions:
+                    del self._by_ticker[record.position_name]
+
+    def get(self, position_id: str):
+        """
+        Retrieves a single position.
+
+        Args:
+            position_id (str): The ID of the position.
+
+        Returns:
+            PositionRecord | None: The record, or None if the position is not open.
+        """
+        return self._by_id.get(position_id)
+
+    def get_by_ticker(self, asset_name: str) -> list:
+        """
+        Retrieves all open positions of an asset in the order they were opened.
+
+        Args:
+            asset_name (str): The ticker of the asset.
+
+        Returns:
+            list: The PositionRecords of that asset (empty if there are none).
+        """
+        with self._lock:
+            return list(self._by_ticker.get(asset_name, {}).values())
+
+    def get_all(self) -> list:
+        """
+        Retrieves all open positions in the book.
+
+        Returns:
+            list: The PositionRecords of every open position.
+        """
+        with self._lock:
+            return list(self._by_id.values())
+
+    def get_user_id(self) -> str:
+        """
+        Retrieves the ID of the user who owns the book.
+
+        Returns:
+            str: The user ID.
+        """
+        return self._user_id
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, position_id: str) -> bool:
+        return position_id in self._by_id
@@ -0,0 +1,163 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+
+# One refresher per database URL and process, shared by all System instances.
+_refreshers = {}
+_refreshers_lock = threading.Lock()
+
+
+class PriceRefresher(threading.Thread):
+    """
+    Background thread that keeps the quotes of hot tickers cached in the market data gateway.
+
+    Hot tickers are the ones held in the most open positions plus the most traded ones in
+    'user_history' over a recent window. On every tick, each hot ticker whose cached quote is
+    missing or would expire before the next tick is re-fetched, in concurrent batches. Since
+    the gateway caches REGULAR/PRE market quotes briefly and CLOSED/POST quotes for much
+    longer, tickers of closed markets are refreshed far less often. Its fetches run at background
+    priority, so they only use the gateway's spare request budget and user orders never queue behind them.
+    The result is that open_position and close_asset almost always find a fresh quote in the cache.
+    """
+
+    def __init__(self, engine, gateway, interval: float = 5.0, top_n: int = 50, batch_size: int = 10,
+                 lookback_days: int = 7, hot_list_interval: float = 60.0):
+        """
+        Initializes a new PriceRefresher instance. The thread is not started yet.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): The engine used to find the hot tickers.
+            gateway (MarketDataGateway): The gateway whose cache is kept warm.
+            interval (float, optional): Seconds between two refresh rounds. Defaults to 5.0.
+            top_n (int, optional): How many hot tickers to keep warm. Defaults to 50.
+            batch_size (int, optional): How many tickers are refreshed concurrently. Defaults to 10.
+            lookback_days (int, optional): The window of 'user_history' used to rank the most
+                traded tickers. Defaults to 7.
+            hot_list_interval (float, optional): Seconds between two reloads of the hot
+                ticker list from the database. Defaults to 60.0.
+        """
+        super().__init__(name='PriceRefresher', daemon=True)
+        self._engine = engine
+        self._gateway = gateway
+        self._interval = interval
+        self._top_n = top_n
+        self._batch_size = batch_size
+        self._lookback_days = lookback_days
+        self._hot_list_interval = hot_list_interval
+        self._hot_tickers = []
+        self._hot_list_age = None
+        self._stop_event = threading.Event()
+        self.refreshed = 0
+        self.failed = 0
+
+    def stop(self):
+        """
+        Asks the thread to stop after its current round.
+        """
+        self._stop_event.set()
+
+    def run(self):
+        """
+        Runs refresh rounds every 'interval' seconds until stopped.
+        """
+        with ThreadPoolExecutor(max_workers=self._batch_size) as executor:
+            while not self._stop_event.is_set():
+                try:
+                    self.refresh_round(executor)
+                except Exception as error:
+                    print(f"Price refresher round failed: {error}")
+                self._stop_event.wait(self._interval)
+
+    def get_hot_tickers(self) -> list:
+        """
+        Retrieves the hot tickers, reloading them from the database when the list is outdated.
+
+        Returns:
+            list: The tickers, hottest first.
+        """
+        now = datetime.datetime.now()
+        if self._hot_list_age is None or (now - self._hot_list_age).total_seconds() >= self._hot_list_interval:
+            query = """
+            SELECT position_name, SUM(score) AS total_score
+            FROM (
+                SELECT position_name, COUNT(*) AS score FROM positions GROUP BY position_name
+                UNION ALL
+                SELECT position_name, COUNT(*) AS score FROM user_history
+                WHERE open_datetime >= :since OR close_datetime >= :since
+                GROUP BY position_name
+            ) AS ranked
+            GROUP BY position_name
+            ORDER BY total_score DESC
+            LIMIT :top_n;
+            """
+            params = {'since': now - datetime.timedelta(days=self._lookback_days), 'top_n': self._top_n}
+            with self._engine.connect() as connection:
+                rows = connection.execute(text(query), params).fetchall()
+            self._hot_tickers = [row[0] for row in rows]
+            self._hot_list_age = now
+        return self._hot_tickers
+
+    def refresh_round(self, executor):
+        """
+        Refreshes, in batches, every hot ticker whose quote is missing or expires before the next round.
+
+        Args:
+            executor (concurrent.futures.Executor): Runs the fetches of a batch concurrently.
+        """
+        due = []
+        for ticker in self.get_hot_tickers():
+            expires_in = self._gateway.expires_in(ticker)
+            if expires_in is None or expires_in <= self._interval * 1.5:
+                due.append(ticker)
+
+        for start in range(0, len(due), self._batch_size):
+            if self._stop_event.is_set():
+                return
+            batch = due[start:start + self._batch_size]
+            for ticker, error in zip(batch, executor.map(self._refresh, batch)):
+                if error is None:
+                    self.refreshed += 1
+                else:
+                    self.failed += 1
+                    print(f"Price refresher could not refresh '{ticker}': {error}")
+
+    def _refresh(self, ticker: str):
+        """
+        Fetches a fresh quote of a ticker into the gateway's cache.
+
+        Args:
+            ticker (str): The ticker symbol.
+
+        Returns:
+            Exception | None: The error raised by the fetch, or None on success.
+        """
+        try:
+            self._gateway.fetch_info(ticker, use_cache=False, background=True)
+            return None
+        except Exception as error:
+            return error
+
+
+def start_price_refresher(engine, gateway, **kwargs) -> PriceRefresher:
+    """
+    Retrieves the process-wide refresher of a database, starting it on first use.
+    Starting a refresher turns on the gateway's quote cache.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The engine used to find the hot tickers.
+        gateway (MarketDataGateway): The gateway whose cache is kept warm.
+        **kwargs: Passed on to the PriceRefresher constructor when a new one is started.
+
+    Returns:
+        PriceRefresher: The running refresher thread.
+    """
+    key = engine.url.render_as_string(hide_password=False)
+    with _refreshers_lock:
+        refresher = _refreshers.get(key)
+        if refresher is None or not refresher.is_alive():
+            gateway.enable_cache()  # Quotes are only cached while a refresher keeps them fresh
+            refresher = PriceRefresher(engine, gateway, **kwargs)
+            refresher.start()
+            _refreshers[key] = refresher
+        return refresher
@@ -0,0 +1,247 @@
+import cProfile
+import csv
+import datetime
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+
+def _mode_from_env(value: str):
+    """
+    Reads the profiling mode from the DH_PROFILE environment variable.
+
+    Args:
+        value (str): The variable's value: 'sample', 'cprofile', a true value ('1', 'true', 'yes',
+            meaning 'sample') or a false/empty value (profiling off).
+
+    Returns:
+        str | None: 'sample', 'cprofile' or None.
+    """
+    value = value.strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return None
+    if value in ('1', 'true', 'yes', 'on'):
+        return 'sample'
+    if value not in ('sample', 'cprofile'):
+        raise ValueError(f"Invalid DH_PROFILE value '{value}'. Please choose 'sample' or 'cprofile'.")
+    return value
+
+
+# Process-wide profiling settings. Profiling is off unless DH_PROFILE is set or profiling() is active.
+_settings = {
+    'mode': _mode_from_env(os.getenv('DH_PROFILE', '')),  # 'sample', 'cprofile' or None
+    'output_dir': os.getenv('DH_PROFILE_DIR', 'profiles'),
+    'interval': float(os.getenv('DH_PROFILE_INTERVAL', '0.005')),
+}
+_call_counter = itertools.count(1)
+_state = threading.local()
+
+
+@contextmanager
+def profiling(mode: str = 'sample', output_dir: str = 'profiles', interval: float = 0.005):
+    """
+    Enables profiling of the decorated System methods inside a with block.
+
+    Args:
+        mode (str, optional): 'sample' for a sampling profiler (low overhead, true call stacks)
+            or 'cprofile' for deterministic profiling. Defaults to 'sample'.
+        output_dir (str, optional): Folder that receives the profile files. Defaults to 'profiles'.
+        interval (float, optional): Seconds between two samples in 'sample' mode. Defaults to 0.005.
+    """
+    if mode not in ('sample', 'cprofile'):
+        raise ValueError(f"Invalid profiling mode '{mode}'. Please choose 'sample' or 'cprofile'.")
+    previous = dict(_settings)
+    _settings.update(mode=mode, output_dir=output_dir, interval=interval)
+    try:
+        yield
+    finally:
+        _settings.clear()
+        _settings.update(previous)
+
+
+def profiled(func):
+    """
+    Decorator that profiles a System method when profiling is enabled.
+
+    Only the outermost profiled call of a thread is recorded, so e.g. the get_funds_db call
+    made by open_position is part of the open_position profile. For every call it writes a
+    collapsed-stack file ('<method>_<time>_<pid>_<n>.folded', ready for flamegraph.pl or
+    speedscope) and appends a row to 'calls.csv' with the wall time split into SQL time,
+    API time and the rest. When profiling is off the wrapper only checks a flag.
+
+    Args:
+        func (callable): The function to be decorated.
+
+    Returns:
+        wrapper: A wrapper function that profiles the original function.
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        mode = _settings['mode']
+        if mode not in ('sample', 'cprofile') or getattr(_state, 'active', False):
+            return func(self, *args, **kwargs)
+
+        _state.active = True
+        db_time, api_time = getattr(self, 'db_time', 0.0), getattr(self, 'api_time', 0.0)
+        started = time.perf_counter()
+        if mode == 'sample':
+            profiler = _Sampler(threading.get_ident(), _settings['interval'], sys._getframe(), func.__code__)
+        else:
+            profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            profiler.disable()
+            wall_time = time.perf_counter() - started
+            _state.active = False
+            try:
+                _write_profile(
+                    func.__name__, profiler, wall_time,
+                    getattr(self, 'db_time', 0.0) - db_time, getattr(self, 'api_time', 0.0) - api_time
+                )
+            except OSError as error:
+                print(f"Could not write the profile of '{func.__name__}': {error}")
+    return wrapper
+
+
+class _Sampler:
+    """
+    Minimal sampling profiler: a helper thread records the call stack of the profiled
+    thread at a fixed interval, counting identical stacks. Stacks are cut at the profiling
+    wrapper, so calls made from different call sites merge, and samples taken outside the
+    profiled method (e.g. while the sampler itself is being stopped) are dropped.
+    """
+
+    def __init__(self, thread_id: int, interval: float, root_frame, entry_code):
+        """
+        Initializes a new _Sampler instance.
+
+        Args:
+            thread_id (int): The ident of the thread to sample.
+            interval (float): Seconds between two samples.
+            root_frame (frame): The frame of the profiling wrapper; it and its callers are not recorded.
+            entry_code (code): The code of the profiled function, called directly by root_frame.
+        """
+        self._thread_id = thread_id
+        self._interval = interval
+        self._root_frame = root_frame
+        self._entry_code = entry_code
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ProfileSampler', daemon=True)
+        self.stacks = Counter()
+
+    def enable(self):
+        """
+        Starts sampling.
+        """
+        self._thread.start()
+
+    def disable(self):
+        """
+        Stops sampling and waits for the helper thread to finish.
+        """
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        """
+        Samples the target thread until disabled.
+        """
+        while not self._stop_event.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            entry = None
+            while frame is not None and frame is not self._root_frame:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                entry = code
+                frame = frame.f_back
+            if frame is not None and entry is self._entry_code:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+def _cprofile_to_folded(profiler: cProfile.Profile) -> Counter:
+    """
+    Converts cProfile statistics to collapsed stacks, weighted by own time in microseconds.
+
+    cProfile only records caller/callee pairs, not full stacks, so each function is placed
+    under its heaviest caller chain. The result is an approximation of the real stacks.
+
+    Args:
+        profiler (cProfile.Profile): A disabled profiler.
+
+    Returns:
+        Counter: Collapsed stack strings mapped to microseconds of own time.
+    """
+    stats = pstats.Stats(profiler).stats
+
+    def _label(func):
+        filename, line, name = func
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    folded = Counter()
+    for func, (_, _, own_time, _, callers) in stats.items():
+        if own_time <= 0 or func[2].startswith("<method 'disable' of '_lsprof"):  # The profiler stopping itself
+            continue
+        chain, seen, current, current_callers = [_label(func)], {func}, func, callers
+        while current_callers:
+            parent = max(current_callers, key=lambda c: current_callers[c][3])  # Heaviest caller by cumulative time
+            if parent in seen or parent not in stats:
+                break
+            seen.add(parent)
+            chain.append(_label(parent))
+            current, current_callers = parent, stats[parent][4]
+        folded[';'.join(reversed(chain))] += int(own_time * 1_000_000)
+    return folded
+
+
+def _write_profile(method: str, profiler, wall_time: float, sql_time: float, api_time: float):
+    """
+    Writes the collapsed stacks of one call and appends its time split to 'calls.csv'.
+
+    The stacks are placed under a root frame named after the method only (e.g. 'System.open_position'),
+    so the files of many calls merge into one flame graph. The per-call SQL/API split goes to
+    'calls.csv' instead.
+
+    Args:
+        method (str): The name of the profiled method.
+        profiler (_Sampler | cProfile.Profile): The disabled profiler of the call.
+        wall_time (float): The total duration of the call in seconds.
+        sql_time (float): Seconds spent executing SQL during the call.
+        api_time (float): Seconds spent waiting on the market data API during the call.
+    """
+    output_dir = _settings['output_dir']
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    call_number = next(_call_counter)
+    base_name = f"System.{method}_{stamp}_{os.getpid()}_{call_number}"
+
+    if isinstance(profiler, _Sampler):
+        stacks = profiler.stacks
+    else:
+        stacks = _cprofile_to_folded(profiler)
+        profiler.dump_stats(os.path.join(output_dir, f"{base_name}.prof"))
+
+    root = f"System.{method}"
+    with open(os.path.join(output_dir, f"{base_name}.folded"), 'w', encoding='utf-8') as out_file:
+        for stack, weight in stacks.items():
+            out_file.write(f"{root};{stack} {weight}\n")
+
+    summary_path = os.path.join(output_dir, 'calls.csv')
+    new_file = not os.path.exists(summary_path)
+    with open(summary_path, 'a', newline='', encoding='utf-8') as summary_file:
+        writer = csv.writer(summary_file)
+        if new_file:
+            writer.writerow(['file', 'method', 'mode', 'wall_ms', 'sql_ms', 'api_ms', 'other_ms'])
+        other_time = max(wall_time - sql_time - api_time, 0.0)
+        writer.writerow([
+            f"{base_name}.folded", method, _settings['mode'], round(wall_time * 1000, 3),
+            round(sql_time * 1000, 3), round(api_time * 1000, 3), round(other_time * 1000, 3)
+        ])
@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+
+class RiskModel:
+    """
+    Computes portfolio risk metrics for a set of open positions from a local history of asset returns.
+
+    All metrics are computed with NumPy matrix operations over a (days x tickers) return
+    matrix. The aligned return matrix, its covariance and its correlation are cached per
+    set of tickers, so repeated calls for the same portfolio skip the expensive part.
+    """
+
+    def __init__(self, returns: pd.DataFrame, periods_per_year: int = 252, cache_size: int = 32,
+                 min_observations: int = 2):
+        """
+        Initializes a new RiskModel instance.
+
+        Args:
+            returns (pd.DataFrame): Periodic (e.g. daily) simple returns, indexed by date,
+                with one column per ticker.
+            periods_per_year (int, optional): Used to annualize the volatility. Defaults to 252.
+            cache_size (int, optional): How many ticker sets to keep cached. Defaults to 32.
+            min_observations (int, optional): The fewest returns a ticker needs to be included, and the
+                fewest dates on which all tickers of a portfolio have a return. Defaults to 2.
+        """
+        self._returns = returns.astype('float64').sort_index()
+        self._periods_per_year = periods_per_year
+        self._cache_size = cache_size
+        self._min_observations = max(2, min_observations)
+        self._observations = self._returns.notna().sum()
+        self._cache = OrderedDict()
+
+    @classmethod
+    def from_price_file(cls, file_path: str, **kwargs) -> 'RiskModel':
+        """
+        Builds a RiskModel from a CSV or Parquet file of prices: the first column holds
+        the dates and every other column the prices of one ticker.
+
+        Args:
+            file_path (str): Path to a .csv or .parquet file.
+            **kwargs: Passed on to the RiskModel constructor.
+
+        Returns:
+            RiskModel: A model over the simple returns of those prices.
+        """
+        if file_path.lower().endswith('.parquet'):
+            prices = pd.read_parquet(file_path)
+            prices = prices.set_index(prices.columns[0])
+        else:
+            prices = pd.read_csv(file_path, index_col=0)
+        prices.index = pd.to_datetime(prices.index)
+        return cls(prices.sort_index().pct_change(fill_method=None).iloc[1:], **kwargs)
+
+    def get_tickers(self) -> list:
+        """
+        Retrieves the tickers the model has a return history for.
+
+        Returns:
+            list: The available tickers.
+        """
+        return list(self._returns.columns)
+
+    def _matrices(self, tickers: tuple) -> tuple:
+        """
+        Retrieves the aligned return matrix, covariance and correlation of a set of tickers.
+        Only dates where every ticker has a return are used, so all matrices are consistent.
+
+        Args:
+            tickers (tuple): The tickers, in the order of the exposure vector.
+
+        Returns:
+            tuple: (returns (T x N), covariance (N x N), correlation (N x N)) as NumPy arrays.
+        """
+        cached = self._cache.get(tickers)
+        if cached is not None:
+            self._cache.move_to_end(tickers)
+            return cached
+
+        matrix = self._returns[list(tickers)].to_numpy()
+        matrix = matrix[~np.isnan(matrix).any(axis=1)]
+        if matrix.shape[0] < self._min_observations:
+            raise ValueError(f"Not enough overlapping return history to compute risk metrics: {matrix.shape[0]} "
+                             f"dates on which all tickers have a return, {self._min_observations} needed.")
+        covariance = np.cov(matrix, rowvar=False, ddof=1).reshape(len(tickers), len(tickers))
+        std = np.sqrt(np.diag(covariance))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = covariance / np.outer(std, std)
+        np.fill_diagonal(correlation, 1.0)
+
+        self._cache[tickers] = (matrix, covariance, correlation)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return self._cache[tickers]
+
+    def position_exposures(self, positions: pd.DataFrame, prices: dict = None) -> pd.Series:
+        """
+        Computes the money exposure of every single position.
+
+        Args:
+            positions (pd.DataFrame): Open positions with position_name, asset_share and open_price columns.
+            prices (dict, optional): Current prices per ticker. When given, exposures are marked to
+                market; otherwise the open price is used. Defaults to None.
+
+        Returns:
+            pd.Series: The exposure per position, with the index of 'positions'.
+        """
+        shares = positions['asset_share'].astype('float64')
+        price = positions['open_price'].astype('float64')
+        if prices:
+            price = positions['position_name'].map(prices).astype('float64').fillna(price)
+        return shares * price
+
+    def exposures(self, positions: pd.DataFrame, prices: dict = None) -> pd.Series:
+        """
+        Computes the money exposure per ticker of a set of positions.
+
+        Args:
+            positions (pd.DataFrame): Open positions with position_name, asset_share and open_price columns.
+            prices (dict, optional): Current prices per ticker. When given, exposures are marked to
+                market; otherwise the open price is used. Defaults to None.
+
+        Returns:
+            pd.Series: The exposure per ticker.
+        """
+        return self.position_exposures(positions, prices).groupby(positions['position_name']).sum()
+
+    def report(self, positions: pd.DataFrame, confidence: float = 0.95, horizon_days: int = 1, prices: dict = None) -> dict:
+        """
+        Computes the risk metrics of a portfolio.
+
+        Tickers with fewer than 'min_observations' returns are left out of every metric and listed
+        under 'missing'. The metrics use the dates on which every remaining ticker has a return, so a
+        ticker with a short history (e.g. a recent listing) shortens the window; 'observations'
+        tells how many dates were used.
+
+        Args:
+            positions (pd.DataFrame): Open positions with position_name, asset_share and open_price columns,
+                and optionally a position_id column that labels the rows of 'contributions'.
+            confidence (float, optional): Confidence level of the Value at Risk. Defaults to 0.95.
+            horizon_days (int, optional): VaR horizon in periods, scaled by the square root of time. Defaults to 1.
+            prices (dict, optional): Current prices per ticker to mark the exposures to market. Defaults to None.
+
+        Returns:
+            dict: With the keys
+                'value' (float): The total exposure covered by the metrics.
+                'volatility' (float): Annualized portfolio volatility, as a fraction.
+                'historical_var' (float): Historical-simulation VaR, in money.
+                'parametric_var' (float): Variance-covariance (normal) VaR, in money.
+                'correlation' (pd.DataFrame): The correlation matrix of the tickers.
+                'contributions' (pd.DataFrame): Ticker, exposure, weight, marginal risk and risk
+                    contribution per position, indexed by position_id.
+                'missing' (list): Tickers that were left out for lack of history.
+                'observations' (int): The number of dates the metrics were computed over.
+        """
+        if not 0 < confidence < 1:
+            raise ValueError("Confidence must be between 0 and 1.")
+        position_exposure = self.position_exposures(positions, prices)
+        exposure = position_exposure.groupby(positions['position_name']).sum()
+        # Tickers without (enough) history are left out instead of shrinking the window of all others to nothing.
+        available = set(self._observations.index[self._observations >= self._min_observations])
+        missing = [t for t in exposure.index if t not in available]
+        exposure = exposure.drop(missing)
+        if exposure.empty or exposure.sum() <= 0:
+            raise ValueError("No positions with return history to compute risk metrics for.")
+
+        tickers = tuple(exposure.index)
+        returns, covariance, correlation = self._matrices(tickers)
+        value = float(exposure.sum())
+        weights = exposure.to_numpy() / value
+
+        # Portfolio variance and each ticker's marginal risk (Σw)_i / σ_p. A position's risk contribution is
+        # its own weight times the marginal risk of its ticker, so the contributions sum up to σ_p.
+        marginal = covariance @ weights
+        sigma = float(np.sqrt(weights @ marginal))
+        marginal_risk = marginal / sigma if sigma > 0 else np.zeros_like(weights)
+
+        portfolio_returns = returns @ weights
+        scale = np.sqrt(horizon_days)
+        historical_var = -float(np.quantile(portfolio_returns, 1 - confidence)) * scale * value
+        z_score = NormalDist().inv_cdf(confidence)
+        parametric_var = (z_score * sigma * scale - float(portfolio_returns.mean()) * horizon_days) * value
+
+        covered = positions['position_name'].isin(tickers).to_numpy()
+        position_names = positions['position_name'].to_numpy()[covered]
+        position_weights = position_exposure.to_numpy()[covered] / value
+        position_marginal = pd.Series(marginal_risk, index=list(tickers)).reindex(position_names).to_numpy()
+        contribution = position_weights * position_marginal
+        position_ids = positions['position_id'] if 'position_id' in positions.columns else positions.index.to_series()
+        contributions = pd.DataFrame({
+            'position_name': position_names,
+            'exposure': position_exposure.to_numpy()[covered],
+            'weight': position_weights,
+            'marginal_risk': position_marginal,
+            'risk_contribution': contribution,
+            'pct_contribution': contribution / sigma if sigma > 0 else np.zeros_like(contribution),
+        }, index=pd.Index(position_ids.to_numpy()[covered], name='position_id'))
+
+        return {
+            'value': value,
+            'volatility': sigma * np.sqrt(self._periods_per_year),
+            'historical_var': historical_var,
+            'parametric_var': parametric_var,
+            'correlation': pd.DataFrame(correlation, index=list(tickers), columns=list(tickers)),
+            'contributions': contributions.sort_values('risk_contribution', ascending=False),
+            'missing': missing,
+            'observations': len(returns),
+        }
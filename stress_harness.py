@@ -0,0 +1,265 @@
+"""
+Concurrency stress harness for the System class.
+
+Several worker processes hammer one user (--users 1) or many users with a mix of
+open_position, close_asset (by position ID and by asset) and modify_funds_db calls,
+while every process reads positions first and then races to change them. Prices come
+from a deterministic offline quote source, so the run measures the database only.
+
+At the end it reports throughput, latency, lock-wait time, deadlocks and other errors,
+then checks the balance invariants of every user:
+- funds == deposits - invested amount of open positions + realized profit/loss
+- funds never negative
+- no position both open and closed, and exactly one OPEN and one CLOSED history row per trade
+
+Example:
+    DB_LOCK_MODE=advisory python stress_harness.py --workers 8 --users 1 --ops 200
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import time
+from main_system import System
+from market_data import MarketDataGateway
+
+TICKERS = ['AAPL', 'MSFT', 'NVDA', 'SPY', 'BTC-USD']
+INITIAL_FUNDS = 100_000.0
+PASSWORD = 'stress-password'
+
+
+def offline_quote(symbol: str) -> dict:
+    """
+    Returns a deterministic, slightly moving quote so that trades produce profits and losses.
+
+    Args:
+        symbol (str): The ticker symbol.
+
+    Returns:
+        dict: An info dictionary shaped like the yfinance one.
+    """
+    base = 50.0 + sum(ord(c) for c in symbol) % 200
+    return {
+        'marketState': 'REGULAR',
+        'regularMarketPrice': round(base * random.uniform(0.95, 1.05), 2),
+        'quoteType': 'EQUITY',
+        'sector': 'Stress',
+    }
+
+
+def is_deadlock(error: Exception) -> bool:
+    """
+    Tells whether an error was raised because PostgreSQL aborted a deadlocked transaction.
+
+    Args:
+        error (Exception): The raised error.
+
+    Returns:
+        bool: True for SQLSTATE 40P01.
+    """
+    original = getattr(error, 'orig', None)
+    return getattr(original, 'pgcode', None) == '40P01' or 'deadlock detected' in str(error)
+
+
+def run_worker(worker_id: int, user_names: list, ops: int, lock_mode: str, seed: int) -> dict:
+    """
+    Runs a random mix of operations as one process, with one logged-in session per user.
+
+    Args:
+        worker_id (int): The number of the worker, for the report.
+        user_names (list): The users this worker trades for.
+        ops (int): The number of operations to run.
+        lock_mode (str): The DB_LOCK_MODE to use ('none', 'row' or 'advisory').
+        seed (int): Seed of the random operation mix.
+
+    Returns:
+        dict: Counters and timings of the worker.
+    """
+    os.environ['DB_LOCK_MODE'] = lock_mode
+    random.seed(seed)
+    gateway = MarketDataGateway(fetcher=offline_quote, rate=1_000_000, burst=1_000_000, regular_ttl=0, closed_ttl=0)
+    stats = {'worker': worker_id, 'ok': 0, 'conflicts': 0, 'deadlocks': 0, 'errors': 0,
+             'latencies': [], 'lock_wait': 0.0, 'deposits': {}}
+    sessions = {}
+    with contextlib.redirect_stdout(io.StringIO()):  # System prints a line per step
+        for user_name in user_names:
+            session = System()
+            session.market_data = gateway
+            session.log_in_user(user_name, PASSWORD)
+            sessions[user_name] = session
+
+        for _ in range(ops):
+            user_name = random.choice(user_names)
+            session = sessions[user_name]
+            operation = random.choices(['open', 'close_id', 'close_asset', 'deposit'], weights=[5, 3, 2, 1])[0]
+            started = time.perf_counter()
+            try:
+                if operation == 'open':
+                    session.open_position(random.choice(TICKERS), round(random.uniform(10, 500), 2))
+                elif operation == 'deposit':
+                    amount = round(random.uniform(10, 100), 2)
+                    session.modify_funds_db(amount)
+                    stats['deposits'][user_name] = stats['deposits'].get(user_name, 0.0) + amount
+                else:
+                    # Read the positions fresh, then race other workers to close them.
+                    book = session.load_position_book()
+                    positions = book.get_all()
+                    if not positions:
+                        continue
+                    target = random.choice(positions)
+                    if operation == 'close_id':
+                        session.close_asset(position_id=target.position_id)
+                    else:
+                        session.close_asset(asset_name=target.position_name)
+                stats['ok'] += 1
+            except ValueError:
+                stats['conflicts'] += 1  # Expected outcome of a lost race (position gone, funds spent)
+            except Exception as error:
+                if is_deadlock(error):
+                    stats['deadlocks'] += 1
+                else:
+                    stats['errors'] += 1
+                    if stats['errors'] <= 3:
+                        stats.setdefault('samples', []).append(f"{operation}: {type(error).__name__}: {str(error).splitlines()[0]}")
+            stats['latencies'].append(time.perf_counter() - started)
+
+    stats['lock_wait'] = sum(session.lock_wait_time for session in sessions.values())
+    return stats
+
+
+def setup_users(count: int) -> list:
+    """
+    Creates (or reuses) the stress users and tops their funds up to INITIAL_FUNDS
+    (users that already hold more from an earlier run keep their balance).
+
+    Args:
+        count (int): The number of users.
+
+    Returns:
+        list: The user names.
+    """
+    user_names = [f"stress_user_{i}" for i in range(count)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_name in user_names:
+            session = System()
+            try:
+                session.register_user(user_name, PASSWORD)
+            except ValueError:
+                pass  # Already exists from an earlier run
+            session.log_in_user(user_name, PASSWORD)
+            session.modify_funds_db(max(INITIAL_FUNDS - session.get_funds_db(primary=True), 0.0))
+            session.log_out_user()
+    return user_names
+
+
+def check_invariants(user_names: list) -> list:
+    """
+    Checks the bookkeeping invariants of the given users that can be read from the tables alone.
+    The balance drift check, which needs the deposits of the run, is done in main().
+
+    Args:
+        user_names (list): The users to check.
+
+    Returns:
+        list: A description of every violation found (empty if all invariants hold).
+    """
+    system = System()
+    violations = []
+    query = """
+    SELECT u.user_name, u.funds,
+        (SELECT COUNT(*) FROM positions p WHERE p.user_id = u.user_id AND p.position_id IN
+            (SELECT t.transaction_id FROM transactions t)) AS open_and_closed,
+        (SELECT COUNT(*) FROM transactions t WHERE t.user_id = u.user_id AND
+            (SELECT COUNT(*) FROM user_history h WHERE h.position_id = t.transaction_id AND h.state = 'CLOSED') <> 1) AS bad_closed_history,
+        (SELECT COUNT(*) FROM user_history h WHERE h.user_id = u.user_id AND h.state = 'OPEN') AS open_events,
+        (SELECT COUNT(*) FROM positions p WHERE p.user_id = u.user_id)
+            + (SELECT COUNT(*) FROM transactions t WHERE t.user_id = u.user_id) AS trades
+    FROM users u
+    WHERE u.user_name = ANY(:names);
+    """
+    for row in system.execute_query(query, {"names": user_names}, fetch="all"):
+        user_name, funds, open_and_closed, bad_closed_history, open_events, trades = row
+        if funds < 0:
+            violations.append(f"{user_name}: negative balance {funds}.")
+        if open_and_closed:
+            violations.append(f"{user_name}: {open_and_closed} positions are both open and closed.")
+        if bad_closed_history:
+            violations.append(f"{user_name}: {bad_closed_history} trades do not have exactly one CLOSED history row.")
+        if open_events != trades:
+            violations.append(f"{user_name}: {open_events} OPEN history rows for {trades} trades.")
+    return violations
+
+
+def balance_snapshot(user_names: list) -> dict:
+    """
+    Computes, per user, funds + invested amount of open positions - realized profit/loss.
+    This equals the total deposited amount, so it may only change by the deposits of a run.
+
+    Args:
+        user_names (list): The users to snapshot.
+
+    Returns:
+        dict: The deposited total per user name.
+    """
+    system = System()
+    query = """
+    SELECT u.user_name,
+        u.funds
+        + COALESCE((SELECT SUM(p.position_amount) FROM positions p WHERE p.user_id = u.user_id), 0)
+        - COALESCE((SELECT SUM(t.loss_profit) FROM transactions t WHERE t.user_id = u.user_id), 0)
+    FROM users u
+    WHERE u.user_name = ANY(:names);
+    """
+    return {row[0]: float(row[1]) for row in system.execute_query(query, {"names": user_names}, fetch="all")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the System under concurrent load on shared accounts.")
+    parser.add_argument('--workers', type=int, default=4, help="Number of worker processes.")
+    parser.add_argument('--users', type=int, default=1, help="Number of users shared by all workers.")
+    parser.add_argument('--ops', type=int, default=100, help="Operations per worker.")
+    parser.add_argument('--lock-mode', choices=['none', 'row', 'advisory'], default=os.getenv('DB_LOCK_MODE', 'none'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    user_names = setup_users(args.users)
+    before = balance_snapshot(user_names)
+
+    started = time.perf_counter()
+    jobs = [(i, user_names, args.ops, args.lock_mode, args.seed + i) for i in range(args.workers)]
+    with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+        results = pool.starmap(run_worker, jobs)
+    elapsed = time.perf_counter() - started
+
+    after = balance_snapshot(user_names)
+    violations = check_invariants(user_names)
+    for user_name in user_names:
+        deposited = sum(r['deposits'].get(user_name, 0.0) for r in results)
+        drift = round(after[user_name] - before[user_name] - deposited, 2)
+        if drift != 0:
+            violations.append(f"{user_name}: balance drifted by {drift}$ (money created or lost).")
+
+    latencies = sorted(l for r in results for l in r['latencies'])
+    total_ops = len(latencies)
+    print(f"Lock mode: {args.lock_mode}, workers: {args.workers}, users: {args.users}, operations: {total_ops}")
+    print(f"Elapsed: {elapsed:.2f}s, throughput: {total_ops / elapsed:.1f} ops/s")
+    if latencies:
+        print(f"Latency p50: {latencies[total_ops // 2] * 1000:.1f}ms, p95: {latencies[int(total_ops * 0.95) - 1] * 1000:.1f}ms, "
+              f"max: {latencies[-1] * 1000:.1f}ms")
+    print(f"Succeeded: {sum(r['ok'] for r in results)}, conflicts: {sum(r['conflicts'] for r in results)}, "
+          f"deadlocks: {sum(r['deadlocks'] for r in results)}, other errors: {sum(r['errors'] for r in results)}")
+    print(f"Total lock-wait time: {sum(r['lock_wait'] for r in results):.3f}s")
+    for sample in [s for r in results for s in r.get('samples', [])][:5]:
+        print(f"  error sample -> {sample}")
+    if violations:
+        print(f"{len(violations)} invariant violations:")
+        for violation in violations:
+            print(f"  {violation}")
+    else:
+        print("All balance invariants hold.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from main_system import System
+from market_data import MarketDataGateway
+from risk import RiskModel
+
+# Quotes served by the fake market data fetcher, keyed by ticker. Tests may change them.
+PRICES = {
+    'AAPL': 200.0, 'MSFT': 400.0, 'NVDA': 100.0, 'TSLA': 250.0, 'BTC-USD': 50000.0, 'SPY': 500.0, 'XOM': 110.0,
+}
+# Sectors of the fake quotes; tickers not listed are 'Technology'.
+SECTORS = {'XOM': 'Energy'}
+
+
+def fake_fetcher(symbol: str) -> dict:
+    """
+    Stands in for yfinance: returns an open-market info dictionary built from PRICES.
+    """
+    if symbol not in PRICES:
+        return {}
+    return {'marketState': 'REGULAR', 'regularMarketPrice': PRICES[symbol], 'quoteType': 'EQUITY', 'sector': SECTORS.get(symbol, 'Technology')}
+
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    """
+    Uses cheap password hashes and restores the fake quotes after every test.
+    """
+    monkeypatch.setenv('BCRYPT_ROUNDS', '4')
+    monkeypatch.delenv('DB_LOCK_MODE', raising=False)
+    monkeypatch.delenv('DB_LISTEN_CHANGES', raising=False)
+    monkeypatch.delenv('PRICE_REFRESHER', raising=False)
+    saved = dict(PRICES)
+    yield
+    PRICES.clear()
+    PRICES.update(saved)
+
+
+def new_session(db_path: str = ':memory:') -> System:
+    """
+    Creates a System on the SQLite backend whose quotes come from fake_fetcher.
+    """
+    system = System(backend='sqlite', db_path=db_path)
+    system.market_data = MarketDataGateway(fetcher=fake_fetcher, rate=1000, burst=1000, regular_ttl=0, closed_ttl=0)
+    return system
+
+
+def new_user(db_path: str, name: str, funds: float) -> System:
+    """
+    Registers a user, logs them in and deposits their funds.
+    """
+    system = new_session(db_path)
+    system.register_user(name, 'password')
+    system.log_in_user(name, 'password')
+    system.modify_funds_db(funds)
+    return system
+
+
+def test_private_memory_databases_are_isolated():
+    first, second = new_session(), new_session()
+    first.register_user('alice', 'password')
+
+    assert first.execute_query("SELECT COUNT(*) FROM users;", fetch="one")[0] == 1
+    assert second.execute_query("SELECT COUNT(*) FROM users;", fetch="one")[0] == 0
+
+
+def test_named_memory_database_is_shared():
+    first, second = new_session(':memory:shared_test'), new_session(':memory:shared_test')
+    first.register_user('alice', 'password')
+
+    assert second.execute_query("SELECT COUNT(*) FROM users;", fetch="one")[0] == 1
+
+
+def test_fast_commands_scenario():
+    db_path = ':memory:scenario_test'
+    pf1 = new_user(db_path, 'JohnDoe1', 5000)
+    pf2 = new_user(db_path, 'JohnDoe2', 3200)
+    pf3 = new_user(db_path, 'JohnDoe3', 3500)
+    pf4 = new_user(db_path, 'JohnDoe4', 2800)
+
+    pf4.open_position('NVDA', 335)
+    pf2.open_position('MSFT', 281)
+    pf1.open_position('AAPL', 410)
+    pf3.open_position('TSLA', 255)
+    pf1.open_position('SPY', 212)
+    pf4.open_position('NVDA', 105)
+    pf3.open_position('BTC-USD', 211)
+    pf1.open_position('AAPL', 315)
+
+    PRICES['AAPL'] = 220.0  # +10%
+    PRICES['NVDA'] = 90.0  # -10%
+    pf1.close_asset(asset_name='AAPL')
+    pf4.close_asset(asset_name='NVDA')
+    pf3.close_asset(position_id=pf3.get_position_book().get_by_ticker('TSLA')[0].position_id)
+
+    assert pf1.get_funds_db() == pytest.approx(5000 - 212 + 72.5)
+    assert pf2.get_funds_db() == pytest.approx(3200 - 281)
+    assert pf3.get_funds_db() == pytest.approx(3500 - 211)
+    assert pf4.get_funds_db() == pytest.approx(2800 - 44)
+
+    positions = pf1.get_portfolio_info('positions')
+    assert positions['position_name'].tolist() == ['SPY']
+    assert positions['position_amount'].dtype == 'float64'
+    assert pd.api.types.is_datetime64_any_dtype(positions['open_datetime'])
+
+    pnl = pf1.get_pnl_by_month()
+    assert pnl['trades'].sum() == 2
+    assert pnl['realized_pnl'].sum() == pytest.approx(72.5)
+
+    history = pf4.get_portfolio_info('history')
+    assert sorted(history['state'].value_counts().items()) == [('CLOSED', 2), ('OPEN', 2)]
+    assert len(pf4.get_position_book()) == 0
+
+
+def test_postgresql_only_features_are_refused(monkeypatch, tmp_path):
+    system = new_session()
+    with pytest.raises(RuntimeError):
+        system.export_bulk(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        system.start_change_listener()
+
+    monkeypatch.setenv('DB_LOCK_MODE', 'row')
+    with pytest.raises(ValueError):
+        new_session()
+
+
+def test_close_by_asset_sees_positions_opened_by_another_session():
+    db_path = ':memory:stale_open_test'
+    session_a = new_user(db_path, 'alice', 1000)
+    session_b = new_session(db_path)
+    session_b.log_in_user('alice', 'password')
+
+    session_a.open_position('AAPL', 100)
+    session_b.close_asset(asset_name='AAPL')
+
+    assert session_b.get_funds_db() == pytest.approx(1000)
+    assert session_b.execute_query("SELECT COUNT(*) FROM positions;", fetch="one")[0] == 0
+
+
+def test_close_by_id_of_position_closed_by_another_session():
+    db_path = ':memory:stale_close_test'
+    session_a = new_user(db_path, 'alice', 1000)
+    session_a.open_position('AAPL', 100)
+    position_id = session_a.get_position_book().get_by_ticker('AAPL')[0].position_id
+    session_b = new_session(db_path)
+    session_b.log_in_user('alice', 'password')
+
+    session_a.close_asset(position_id=position_id)
+    with pytest.raises(ValueError):
+        session_b.close_asset(position_id=position_id)
+
+    assert position_id not in session_b.get_position_book()
+    assert session_b.get_funds_db() == pytest.approx(1000)
+
+
+def test_import_skips_only_rows_that_do_not_fit(tmp_path):
+    system = new_user(':memory:', 'alice', 1000)
+    file_path = tmp_path / 'portfolio.csv'
+    pd.DataFrame({'Ticker': ['AAPL', 'MSFT', 'NVDA', 'nope!'], 'Amount': [900, 200, 50, 30]}).to_csv(file_path, index=False)
+
+    report = system.import_portfolio_file(str(file_path))
+
+    assert report['status'].tolist() == ['OPENED', 'FAILED', 'OPENED', 'FAILED']
+    assert report['error'].tolist()[1] == "Insufficient funds."
+    assert report['error'].tolist()[3] == "Invalid ticker symbol."
+    assert system.get_funds_db() == pytest.approx(50)
+    assert len(system.get_position_book()) == 2
+
+
+def test_risk_contribution_is_reported_per_position():
+    system = new_user(':memory:', 'alice', 1000)
+    system.open_position('AAPL', 200)
+    system.open_position('AAPL', 100)
+    system.open_position('MSFT', 300)
+    generator = np.random.default_rng(7)
+    returns = pd.DataFrame(generator.normal(0, 0.01, size=(250, 2)), columns=['AAPL', 'MSFT'],
+                           index=pd.date_range('2024-01-01', periods=250))
+
+    metrics = system.get_risk_metrics(RiskModel(returns))
+    contributions = metrics['contributions']
+
+    assert sorted(contributions.index) == sorted(r.position_id for r in system.get_position_book().get_all())
+    aapl = contributions[contributions['position_name'] == 'AAPL'].sort_values('exposure')
+    assert aapl['risk_contribution'].iloc[1] == pytest.approx(2 * aapl['risk_contribution'].iloc[0])
+    assert contributions['risk_contribution'].sum() == pytest.approx(metrics['volatility'] / np.sqrt(252))
+
+
+def test_api_calls_count_only_network_fetches():
+    system = new_user(':memory:', 'alice', 1000)
+    system.market_data = MarketDataGateway(fetcher=fake_fetcher, cache_enabled=True)
+    system.show_db_api_calls()
+
+    system.get_asset_current_price('AAPL')
+    system.get_asset_current_price('AAPL')
+    system.get_assets_data_api(['AAPL', 'MSFT'])
+
+    assert system.api_calls == 2
+
+
+def test_replicas_are_used_only_once_they_replayed_the_last_write(monkeypatch):
+    system = new_session()
+    replica_a, replica_b = object(), object()
+    system.replica_engines = [replica_a, replica_b]
+    replayed = {replica_a: False, replica_b: False}
+
+    def fake_wal_position(engine, query, params=None):
+        return '0/10' if engine is system.engine else replayed[engine]
+    monkeypatch.setattr(system, 'read_wal_position', fake_wal_position)
+
+    system.write_pending = True
+    assert system.select_engine(read_only=True) is system.engine  # Both replicas lag behind the write
+    replayed[replica_b] = True
+    assert system.select_engine(read_only=True) is replica_b
+    replayed[replica_a] = True
+    assert {system.select_engine(read_only=True) for _ in range(2)} == {replica_a, replica_b}
+    assert system.write_lsn is None
+    assert system.select_engine(read_only=False) is system.engine
+
+
+def test_close_by_asset_closes_positions_missing_from_a_partly_stale_book():
+    db_path = ':memory:partly_stale_test'
+    session_b = new_user(db_path, 'alice', 1000)
+    session_a = new_session(db_path)
+    session_a.log_in_user('alice', 'password')
+
+    session_b.open_position('AAPL', 100)
+    session_a.open_position('AAPL', 200)
+    session_b.close_asset(asset_name='AAPL')
+
+    assert session_b.execute_query("SELECT COUNT(*) FROM positions;", fetch="one")[0] == 0
+    assert session_b.get_funds_db() == pytest.approx(1000)
+
+
+def test_allocation_weights_across_sectors():
+    system = new_user(':memory:', 'alice', 1000)
+    system.open_position('AAPL', 300)
+    system.open_position('XOM', 100)
+
+    allocation = system.get_allocation().set_index('sector')
+
+    assert allocation.loc['Technology', 'weight'] == pytest.approx(0.75)
+    assert allocation.loc['Energy', 'weight'] == pytest.approx(0.25)
+    assert allocation['invested'].sum() == pytest.approx(400)
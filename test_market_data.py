@@ -0,0 +1,84 @@
+import threading
+import time
+
+from market_data import MarketDataGateway
+
+
+class CountingFetcher:
+    """
+    Fake fetcher that returns a fixed market state and counts its calls.
+    """
+
+    def __init__(self, market_state: str = 'REGULAR'):
+        self.market_state = market_state
+        self.calls = 0
+
+    def __call__(self, symbol: str) -> dict:
+        self.calls += 1
+        return {'marketState': self.market_state, 'regularMarketPrice': 100.0, 'previousClose': 99.0}
+
+
+def test_quotes_are_not_cached_until_enabled():
+    fetcher = CountingFetcher()
+    gateway = MarketDataGateway(fetcher=fetcher)
+
+    gateway.fetch_info('AAPL')
+    gateway.fetch_info('AAPL')
+    assert fetcher.calls == 2
+
+    gateway.enable_cache()
+    gateway.fetch_info('AAPL')
+    gateway.fetch_info('AAPL')
+    assert fetcher.calls == 3
+
+
+def test_pre_market_quotes_use_the_short_ttl():
+    gateway = MarketDataGateway(fetcher=CountingFetcher(), regular_ttl=15, closed_ttl=300)
+
+    assert gateway.ttl_for({'marketState': 'PRE'}) == 15
+    assert gateway.ttl_for({'marketState': 'REGULAR'}) == 15
+    assert gateway.ttl_for({'marketState': 'CLOSED'}) == 300
+
+
+def test_background_fetches_leave_the_reserve_to_user_requests():
+    fetcher = CountingFetcher()
+    gateway = MarketDataGateway(fetcher=fetcher, rate=0.5, burst=4, reserve=2)
+    refresher = threading.Thread(
+        target=lambda: [gateway.fetch_info(f"T{n}", use_cache=False, background=True) for n in range(10)], daemon=True
+    )
+    refresher.start()
+    time.sleep(0.2)
+
+    started = time.monotonic()
+    gateway.fetch_info('AAPL')
+    gateway.fetch_info('MSFT')
+
+    assert time.monotonic() - started < 0.5
+    assert fetcher.calls == 4  # 2 background fetches (burst minus reserve) and the 2 user requests
+
+
+def test_lookup_reports_only_real_fetches():
+    gateway = MarketDataGateway(fetcher=CountingFetcher(), cache_enabled=True)
+
+    assert gateway.lookup('AAPL')[1] is True
+    assert gateway.lookup('AAPL')[1] is False
+
+
+def test_zero_ttl_is_never_stored_and_cache_is_bounded():
+    gateway = MarketDataGateway(fetcher=CountingFetcher('CLOSED'), cache_enabled=True, closed_ttl=0)
+    gateway.fetch_info('AAPL')
+    assert gateway.metrics()['cached_symbols'] == 0
+
+    gateway = MarketDataGateway(fetcher=CountingFetcher(), cache_enabled=True, cache_size=3)
+    for symbol in ['A', 'B', 'C', 'D', 'E']:
+        gateway.fetch_info(symbol)
+    assert gateway.metrics()['cached_symbols'] == 3
+    assert gateway.expires_in('A') is None and gateway.expires_in('E') is not None
+
+
+def test_burst_of_one_gets_no_reserve():
+    fetcher = CountingFetcher()
+    gateway = MarketDataGateway(fetcher=fetcher, burst=1)
+
+    gateway.fetch_info('AAPL', background=True)
+    assert fetcher.calls == 1
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from profiling import _mode_from_env, profiled, profiling
+
+
+class Service:
+    """
+    Minimal stand-in for System with the timing attributes read by the profiling hooks.
+    """
+
+    db_time = 0.0
+    api_time = 0.0
+
+    @profiled
+    def work(self, n: int) -> int:
+        return sum(i * i for i in range(n))
+
+
+def test_profiles_of_several_calls_share_one_root(tmp_path):
+    service = Service()
+    with profiling(mode='cprofile', output_dir=str(tmp_path)):
+        service.work(20_000)
+        service.work(30_000)
+
+    folded_files = sorted(f for f in os.listdir(tmp_path) if f.endswith('.folded'))
+    assert len(folded_files) == 2
+    roots = set()
+    for name in folded_files:
+        with open(tmp_path / name, encoding='utf-8') as folded:
+            roots.update(line.split(';', 1)[0] for line in folded if line.strip())
+    assert roots == {'System.work'}
+
+    with open(tmp_path / 'calls.csv', encoding='utf-8') as summary:
+        assert len(summary.read().splitlines()) == 3  # Header and one row per call
+
+
+def call_site_a(service):
+    return service.work(500_000)
+
+
+def call_site_b(service):
+    return service.work(500_000)
+
+
+def test_sampled_stacks_start_at_the_profiled_method(tmp_path):
+    service = Service()
+    with profiling(mode='sample', output_dir=str(tmp_path), interval=0.001):
+        call_site_a(service)
+        call_site_b(service)
+
+    frames = set()
+    for name in os.listdir(tmp_path):
+        if name.endswith('.folded'):
+            with open(tmp_path / name, encoding='utf-8') as folded:
+                frames.update(line.split(';')[1].split(' (')[0] for line in folded if line.strip())
+    assert frames == {'work'}  # No caller, wrapper or profiler frames
+
+
+def test_dh_profile_values():
+    assert _mode_from_env('') is None
+    assert _mode_from_env('0') is None
+    assert _mode_from_env('1') == 'sample'
+    assert _mode_from_env('True') == 'sample'
+    assert _mode_from_env('cprofile') == 'cprofile'
+    with pytest.raises(ValueError):
+        _mode_from_env('flamegraph')
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk import RiskModel
+
+
+def make_returns(days: int = 100) -> pd.DataFrame:
+    """
+    Builds random daily returns for AAPL and MSFT, plus an EMPTY column without any return.
+    """
+    generator = np.random.default_rng(3)
+    returns = pd.DataFrame(generator.normal(0, 0.01, size=(days, 2)), columns=['AAPL', 'MSFT'],
+                           index=pd.date_range('2024-01-01', periods=days))
+    returns['EMPTY'] = np.nan
+    return returns
+
+
+def positions_of(*tickers) -> pd.DataFrame:
+    return pd.DataFrame({'position_name': list(tickers), 'asset_share': 1.0, 'open_price': 100.0})
+
+
+def test_ticker_without_returns_is_reported_as_missing():
+    report = RiskModel(make_returns()).report(positions_of('AAPL', 'MSFT', 'EMPTY'))
+
+    assert report['missing'] == ['EMPTY']
+    assert report['observations'] == 100
+    assert report['value'] == pytest.approx(200.0)
+
+
+def test_short_history_shortens_the_window_and_is_reported():
+    returns = make_returns()
+    returns.loc[returns.index[:70], 'MSFT'] = np.nan
+
+    assert RiskModel(returns).report(positions_of('AAPL', 'MSFT'))['observations'] == 30
+
+    report = RiskModel(returns, min_observations=50).report(positions_of('AAPL', 'MSFT'))
+    assert report['missing'] == ['MSFT']
+    assert report['observations'] == 100
+
+
+def test_too_few_overlapping_dates_raise():
+    returns = make_returns()
+    returns.loc[returns.index[:60], 'MSFT'] = np.nan
+    returns.loc[returns.index[40:], 'AAPL'] = np.nan
+
+    with pytest.raises(ValueError):
+        RiskModel(returns, min_observations=10).report(positions_of('AAPL', 'MSFT'))